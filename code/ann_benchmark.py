@@ -0,0 +1,84 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from file_utils import save_text_to_file
+from ivf_index import IVFIndex
+from paths import OUTPUTS_DIR
+
+
+def make_clustered_vectors(n: int, dim: int, clusters: int, seed: int = 0, noise_scale: float = 0.5) -> np.ndarray:
+    """Generates embedding-like vectors scattered around random cluster centres."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    noise = rng.normal(scale=noise_scale, size=(n, dim)).astype(np.float32)
+    return centres[rng.integers(0, clusters, size=n)] + noise
+
+
+def recall_at_k(approximate: list[np.ndarray], exact: np.ndarray) -> float:
+    """Fraction of the exact top-k rows that the approximate search also returned."""
+    k = exact.shape[1]
+    return float(np.mean([len(set(rows.tolist()) & set(true_rows.tolist())) / k
+                          for rows, true_rows in zip(approximate, exact)]))
+
+
+def run_benchmark(n: int, dim: int, n_queries: int, k: int, n_lists: int, probes: list[int]) -> str:
+    """Compares IVF search at several n_probe settings with exact search and returns a markdown report."""
+    vectors = make_clustered_vectors(n, dim, clusters=max(n_lists // 2, 1))
+    queries = make_clustered_vectors(n_queries, dim, clusters=max(n_lists // 2, 1), seed=1)
+
+    started = time.perf_counter()
+    index = IVFIndex(dim, n_lists=n_lists)
+    index.add(vectors)
+    if not index.trained:
+        index.train()
+    build_s = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        started = time.perf_counter()
+        index.save(index_dir)
+        save_s = time.perf_counter() - started
+        started = time.perf_counter()
+        index = IVFIndex.load(index_dir)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        exact_rows, _ = index.exact_search(queries, k)
+        exact_ms = (time.perf_counter() - started) * 1000 / n_queries
+
+        content = ["# ANN INDEX BENCHMARK", "=" * 60, ""]
+        content.append(f"{n:,} vectors x {dim} dims, {n_lists} lists, {n_queries} queries, recall@{k}")
+        content.append("")
+        content.append(f"Build (add + train): {build_s:.2f}s, save: {save_s:.2f}s, load (memory-mapped): {load_ms:.1f}ms")
+        content.append("")
+        content.append(f"| Search | Recall@{k} | Latency (ms/query) | Speed-up vs exact |")
+        content.append("|--------|-----------|--------------------|-------------------|")
+        content.append(f"| exact | 1.000 | {exact_ms:.3f} | 1.0x |")
+        for n_probe in probes:
+            started = time.perf_counter()
+            results = index.search(queries, k, n_probe=n_probe)
+            latency_ms = (time.perf_counter() - started) * 1000 / n_queries
+            recall = recall_at_k([rows for rows, _ in results], exact_rows)
+            content.append(f"| IVF n_probe={n_probe} | {recall:.3f} | {latency_ms:.3f} | {exact_ms / latency_ms:.1f}x |")
+        content.append("")
+    return "\n".join(content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of the IVF index against exact search.")
+    parser.add_argument("--vectors", type=int, default=200_000, help="Number of indexed vectors.")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension (all-MiniLM-L6-v2 uses 384).")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--k", type=int, default=10, help="Results per query.")
+    parser.add_argument("--lists", type=int, default=512, help="Number of IVF lists.")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="n_probe values.")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.vectors, args.dim, args.queries, args.k, args.lists, args.probes)
+    print(report)
+    filename = "ann_benchmark_results.md"
+    save_text_to_file(report, os.path.join(OUTPUTS_DIR, filename), header="ANN Index Benchmark Results")
+    print(f"    ✓ Results saved to {filename}")
@@ -1,19 +1,37 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 from dotenv import load_dotenv
 from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from embedding_cache import get_embeddings
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
 load_dotenv()
-def process_file(file_path):
+def create_splitter() -> RecursiveCharacterTextSplitter:
+    """Creates the text splitter shared by process_file and the ingestion pipeline."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+def process_file(file_path, vector_store_cls: type[VectorStore] | None = None, **store_kwargs) -> VectorStore:
+    """Chunks a file, embeds the chunks and returns a searchable vector store.
+
+    Args:
+        file_path: Text file to process.
+        vector_store_cls: Store to build, e.g. Chroma (default, imported on first use), NumpyVectorStore,
+            IVFVectorStore for large corpora or QuantizedVectorStore to keep int8/product-quantized embeddings
+            in memory.
+        store_kwargs: Extra arguments for the store's from_documents, e.g. n_lists/n_probe for IVFVectorStore or
+            mode/rerank_candidates for QuantizedVectorStore.
+    """
     # 1. Read the file
     with open(file_path, 'r', encoding='utf-8') as f:
         text = f.read()
     # 2. Create chunks by intelligent splitting
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50
-    )
+    splitter = create_splitter()
     chunks = splitter.split_text(text)
     # 3. Create documents from chunks
     documents = [
@@ -22,7 +40,10 @@ def process_file(file_path):
             metadata = {"source": file_path, "chunk_id": i}
         ) for i, chunk in enumerate(chunks)
     ]
-    # 4. Create searchable vector store
-    embeddings = HuggingFaceEmbeddings(model_name = 'all-MiniLM-L6-v2')
-    vector_store = Chroma.from_documents(documents, embeddings)
+    # 4. Create searchable vector store (embeddings of unchanged chunks come from the on-disk cache)
+    embeddings = get_embeddings('all-MiniLM-L6-v2')
+    if vector_store_cls is None:
+        from langchain_community.vectorstores import Chroma
+        vector_store_cls = Chroma
+    vector_store = vector_store_cls.from_documents(documents, embeddings, **store_kwargs)
     return vector_store
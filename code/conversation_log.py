@@ -0,0 +1,190 @@
+import json
+import os
+import time
+from array import array
+from collections.abc import Iterator
+
+# Each index row is two int64 values: the byte offset of the entry in the log and its type code
+ENTRY_TYPES = {"message": 0, "summary": 1, "tokens": 2, "snapshot": 3}
+
+
+class ConversationLog:
+    """Append-only, crash-safe log of one conversation session.
+
+    Entries (messages, summaries, token counts, snapshots) are JSON lines in `<session>.log`; a binary
+    index `<session>.idx` records the byte offset and type of every entry, so the latest snapshot and the
+    entries after it are found without reading the whole log. Writes are buffered and fsynced in batches
+    of `fsync_batch` entries or every `fsync_interval` seconds, whichever comes first.
+
+    After a crash, entries that were not completely written are dropped on open, and index rows that
+    were lost are rebuilt from the tail of the log.
+    """
+
+    def __init__(self, log_dir: str, session_id: str, fsync_batch: int = 16, fsync_interval: float = 1.0):
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_path = os.path.join(log_dir, f"{session_id}.log")
+        self.index_path = os.path.join(log_dir, f"{session_id}.idx")
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self._offsets, self._types = self._recover()
+        self._log = open(self.log_path, "ab")
+        self._index_file = open(self.index_path, "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _recover(self) -> tuple[array, array]:
+        """Loads the index, dropping torn entries and re-indexing complete entries the index missed.
+
+        Returns:
+            The entry offsets and type codes.
+        """
+        if not os.path.exists(self.log_path):
+            open(self.log_path, "wb").close()
+        stored = array("q")
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            stored.frombytes(data[:len(data) - len(data) % 16])
+        offsets, types = stored[0::2], stored[1::2]
+        log_size = os.path.getsize(self.log_path)
+        while offsets and offsets[-1] >= log_size:
+            offsets.pop()
+            types.pop()
+        # Re-read from the last indexed entry (it may be torn) to the end of the log
+        start = offsets.pop() if offsets else 0
+        del types[len(offsets):]
+        with open(self.log_path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry_type = json.loads(line)["type"]
+                except (ValueError, KeyError):
+                    break
+                offsets.append(offset)
+                types.append(ENTRY_TYPES[entry_type])
+                offset += len(line)
+        if offset < log_size:
+            with open(self.log_path, "r+b") as f:
+                f.truncate(offset)
+        if (offsets, types) != (stored[0::2], stored[1::2]):
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self._index_rows(offsets, types))
+            os.replace(tmp_path, self.index_path)
+        return offsets, types
+
+    @staticmethod
+    def _index_rows(offsets: array, types: array) -> bytes:
+        rows = array("q", [0]) * (2 * len(offsets))
+        rows[0::2], rows[1::2] = offsets, types
+        return rows.tobytes()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def append(self, entry_type: str, **fields) -> int:
+        """Appends an entry and returns its position. It is durable after the next (batched) fsync."""
+        line = json.dumps({"type": entry_type, **fields}, ensure_ascii=False).encode("utf-8") + b"\n"
+        offset = self._log.tell()
+        self._log.write(line)
+        self._index_file.write(array("q", [offset, ENTRY_TYPES[entry_type]]).tobytes())
+        self._offsets.append(offset)
+        self._types.append(ENTRY_TYPES[entry_type])
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+        return len(self._offsets) - 1
+
+    def sync(self) -> None:
+        """Flushes buffered entries and fsyncs the log, then the index."""
+        for f in (self._log, self._index_file):
+            f.flush()
+            os.fsync(f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def entries(self, start: int = 0, stop: int | None = None) -> list[dict]:
+        """Reads the entries at positions [start, stop)."""
+        self._log.flush()
+        stop = len(self._offsets) if stop is None else stop
+        if start >= stop:
+            return []
+        begin = self._offsets[start]
+        end = self._offsets[stop] if stop < len(self._offsets) else os.path.getsize(self.log_path)
+        with open(self.log_path, "rb") as f:
+            f.seek(begin)
+            return [json.loads(line) for line in f.read(end - begin).splitlines()]
+
+    def replay(self) -> Iterator[dict]:
+        """Yields every entry in order."""
+        self._log.flush()
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def last_position(self, entry_type: str) -> int | None:
+        """Position of the latest entry of a type, scanning the index backwards."""
+        code = ENTRY_TYPES[entry_type]
+        for position in range(len(self._types) - 1, -1, -1):
+            if self._types[position] == code:
+                return position
+        return None
+
+    def resume(self) -> tuple[dict | None, list[dict]]:
+        """Returns the latest snapshot (or None) and the entries after it, reading only that part of the log."""
+        position = self.last_position("snapshot")
+        if position is None:
+            return None, self.entries()
+        snapshot, *recent = self.entries(position)
+        return snapshot, recent
+
+    def compact(self, snapshot: dict, keep_last: int = 0) -> None:
+        """Replaces the log with a snapshot entry followed by its last `keep_last` entries.
+
+        Args:
+            snapshot: State that the dropped entries are folded into, e.g. the latest summary.
+            keep_last: Number of most recent entries to keep after the snapshot.
+        """
+        recent = self.entries(max(len(self._offsets) - keep_last, 0)) if keep_last else []
+        self.sync()
+        self._log.close()
+        self._index_file.close()
+        offsets, types, lines = array("q"), array("q"), []
+        offset = 0
+        for entry in [{**snapshot, "type": "snapshot"}] + recent:
+            line = json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n"
+            offsets.append(offset)
+            types.append(ENTRY_TYPES[entry["type"]])
+            lines.append(line)
+            offset += len(line)
+        # Empty the index first: if the process dies before both files are replaced, the index is
+        # rebuilt from whichever log is on disk when the session is opened again
+        open(self.index_path, "wb").close()
+        for path, data in ((self.log_path, b"".join(lines)), (self.index_path, self._index_rows(offsets, types))):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        self._offsets, self._types = offsets, types
+        self._log = open(self.log_path, "ab")
+        self._index_file = open(self.index_path, "ab")
+
+    def reset(self) -> None:
+        """Discards all entries."""
+        self._log.close()
+        self._index_file.close()
+        open(self.log_path, "wb").close()
+        open(self.index_path, "wb").close()
+        self._offsets, self._types = array("q"), array("q")
+        self._log = open(self.log_path, "ab")
+        self._index_file = open(self.index_path, "ab")
+
+    def close(self) -> None:
+        self.sync()
+        self._log.close()
+        self._index_file.close()
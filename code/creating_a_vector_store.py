@@ -1,9 +1,11 @@
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 
-# 1. Choose a model that turns text into embeddings
-embeddings = HuggingFaceEmbeddings(model_name = 'all-MiniLM-L6-v2')
+from embedding_cache import get_embeddings
+from numpy_vector_store import NumpyVectorStore
+
+# 1. Choose a model that turns text into embeddings (cached on disk across runs)
+embeddings = get_embeddings('all-MiniLM-L6-v2')
 
 # 2. Prepare the documents with metadata
 texts = [' Kerala is located in the southwestern region of India. ',
@@ -39,9 +41,20 @@ documents = [
     for i, text in enumerate(texts)
 ]
 # 3. Create the Vector Store using Chroma
-vector_store = Chroma.from_documents(documents)
+vector_store = Chroma.from_documents(documents, embeddings)
 # 4. Perform a similarity search
 query = "How hot is it in Kerala?"
 results = vector_store.similarity_search_with_score(query, k=3)
 for doc, score in results:
-    print(f"Score: {score:.4f}, Document: {doc.page_content}, Metadata: {doc.metadata}")
\ No newline at end of file
+    print(f"Score: {score:.4f}, Document: {doc.page_content}, Metadata: {doc.metadata}")
+
+# 5. The same search with the in-memory NumPy store: several queries at once, filtered by metadata
+numpy_store = NumpyVectorStore.from_documents(documents, embeddings)
+queries = ["How hot is it in Kerala?", "What can tourists see in Kerala?"]
+batch_results = numpy_store.batch_similarity_search_with_score(
+    queries, k=2, filter={"topic": ["climate", "tourism", "wildlife"], "type": "fact"}
+)
+for query, results in zip(queries, batch_results):
+    print(f"\nQuery: {query}")
+    for doc, score in results:
+        print(f"Similarity: {score:.4f}, Document: {doc.page_content}, Metadata: {doc.metadata}")
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from paths import EMBEDDING_CACHE_DIR
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+class EmbeddingStore:
+    """Append-only, content-addressed store of float32 vectors for one embedding model.
+
+    Vectors are appended to a raw float32 file that is read back through a memory map, and the
+    hash of each text is appended to a key file whose line number is the vector's row. Reads and
+    appends are serialized by a lock, so one store can be shared by threads.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        self.model_name = model_name
+        self.cache_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self.keys_path = os.path.join(self.cache_dir, "keys.txt")
+        self.meta_path = os.path.join(self.cache_dir, "meta.json")
+        self.index: dict[str, int] = {}
+        self.dim: int | None = None
+        self._matrix: np.ndarray | None = None
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        """Loads the key index, ignoring keys whose vector was not fully written."""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+        complete_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        # meta.json is written before the first rows, so a crash may leave it without a key file
+        lines = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        keys = lines[:complete_rows]
+        self.index = {key: row for row, key in enumerate(keys)}
+
+        # Drop the tail of an interrupted append so that key rows and vector rows stay aligned
+        if len(lines) != len(keys) or complete_rows != len(keys):
+            with open(self.keys_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{key}\n" for key in keys)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(len(keys) * 4 * self.dim)
+
+    def key(self, text: str, kind: str = "doc") -> str:
+        """Returns the cache key of a text for this model. Asymmetric models embed queries and documents
+        differently, so `kind` ("query" or "doc") is part of the key."""
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def matrix(self) -> np.ndarray:
+        """Returns a read-only memory map over all stored vectors."""
+        if self._matrix is None:
+            rows = len(self.index)
+            if rows == 0 or self.dim is None:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def get(self, key: str) -> list[float] | None:
+        """Returns the stored vector for a key, or None if it is not cached."""
+        with self._lock:
+            row = self.index.get(key)
+            if row is None:
+                return None
+            return self.matrix()[row].tolist()
+
+    def add_many(self, keys: list[str], vectors: list[list[float]]) -> None:
+        """Appends new vectors to the store. Keys that are already stored (or repeated) are skipped."""
+        with self._lock:
+            new = list({key: vector for key, vector in zip(keys, vectors) if key not in self.index}.items())
+            if not new:
+                return
+            array = np.asarray([vector for _, vector in new], dtype=np.float32)
+            if self.dim is None:
+                self.dim = array.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+            elif array.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {array.shape[1]}")
+
+            # Vectors are written before keys so that a crash never leaves a key without its vector
+            with open(self.vectors_path, "ab") as f:
+                f.write(array.tobytes())
+            with open(self.keys_path, "a", encoding="utf-8") as f:
+                f.writelines(f"{key}\n" for key, _ in new)
+            for key, _ in new:
+                self.index[key] = len(self.index)
+            self._matrix = None
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings that look texts up in an on-disk store before calling the wrapped model.
+
+    Re-embedding an unchanged corpus performs no model forward passes; only texts that have not
+    been seen before are sent to the model, in a single batch.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.embeddings = embeddings
+        self.store = EmbeddingStore(cache_dir, model_name)
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self.store.key(text) for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in self.store.index}
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        if missing:
+            self.store.add_many(list(missing), self.embeddings.embed_documents(list(missing.values())))
+        return [self.store.get(key) for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self.store.key(text, kind="query")
+        if (vector := self.store.get(key)) is not None:
+            self.hits += 1
+            return vector
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self.store.add_many([key], [vector])
+        return vector
+
+
+def get_embeddings(model_name: str = DEFAULT_EMBEDDING_MODEL, workers: int = 0) -> CachedEmbeddings:
+    """Returns the shared HuggingFace embedding model wrapped with the persistent embedding cache.
+
+    The model is loaded on the first call for a (model_name, workers) pair and reused by every later
+    caller in the process; the HuggingFace stack is only imported then.
+
+    Args:
+        model_name: Sentence-transformer model name.
+        workers: If greater than 1, cache misses are embedded by this many worker processes.
+
+    Returns:
+        Embeddings that reuse vectors computed in earlier runs.
+    """
+    # Positional arguments, so get_embeddings() and get_embeddings(DEFAULT_EMBEDDING_MODEL) share one model
+    return load_embeddings(model_name, workers if workers > 1 else 0)
+
+
+@lru_cache(maxsize=None)
+def load_embeddings(model_name: str, workers: int) -> CachedEmbeddings:
+    """Loads an embedding model once per process. Use get_embeddings."""
+    if workers > 1:
+        from parallel_embeddings import ParallelEmbeddings
+        embeddings = ParallelEmbeddings(model_name, workers=workers)
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    return CachedEmbeddings(embeddings, model_name=model_name)
@@ -0,0 +1,110 @@
+import asyncio
+import random
+import re
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_MODEL_NAME = "fake-chat-model"
+
+
+class FakeProviderError(Exception):
+    """Simulated provider failure raised by FakeChatModel."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model that answers with canned text after a fixed delay.
+
+    Used to run the memory strategy benchmark and other scripts without network access or API keys.
+    The answer echoes the last user message so that conversations stay distinguishable in reports.
+    When streamed, `latency` is the time to the first chunk and `token_latency` the delay between
+    the following word chunks.
+
+    For testing routing and retries, `latency_jitter` adds a random delay of up to that many seconds,
+    and calls fail with a FakeProviderError with probability `error_rate` (HTTP 500) or
+    `rate_limit_rate` (HTTP 429).
+    """
+
+    model_name: str = FAKE_MODEL_NAME
+    latency: float = 0.0
+    token_latency: float = 0.0
+    latency_jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    response_template: str = "This is a placeholder answer to: {question}"
+
+    @property
+    def _llm_type(self) -> str:
+        return FAKE_MODEL_NAME
+
+    def _first_delay(self) -> float:
+        """Delay before the response (or its first chunk), including jitter."""
+        return self.latency + (random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+
+    def _maybe_fail(self) -> None:
+        """Raises a simulated provider error according to the configured failure rates."""
+        draw = random.random()
+        if draw < self.rate_limit_rate:
+            raise FakeProviderError(f"{self.model_name}: rate limit exceeded", status_code=429)
+        if draw < self.rate_limit_rate + self.error_rate:
+            raise FakeProviderError(f"{self.model_name}: internal server error")
+
+    def _build_content(self, messages: list[BaseMessage]) -> str:
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        return self.response_template.format(question=str(question).strip())
+
+    def _build_result(self, messages: list[BaseMessage]) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._build_content(messages)))])
+
+    def _build_chunks(self, messages: list[BaseMessage]) -> list[ChatGenerationChunk]:
+        """Splits the answer into word chunks, each keeping its trailing whitespace."""
+        return [
+            ChatGenerationChunk(message=AIMessageChunk(content=word))
+            for word in re.findall(r"\S+\s*", self._build_content(messages))
+        ]
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if delay := self._first_delay():
+            time.sleep(delay)
+        self._maybe_fail()
+        return self._build_result(messages)
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if delay := self._first_delay():
+            await asyncio.sleep(delay)
+        self._maybe_fail()
+        return self._build_result(messages)
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, chunk in enumerate(self._build_chunks(messages)):
+            delay = self._first_delay() if i == 0 else self.token_latency
+            if delay:
+                time.sleep(delay)
+            if i == 0:
+                self._maybe_fail()
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        for i, chunk in enumerate(self._build_chunks(messages)):
+            delay = self._first_delay() if i == 0 else self.token_latency
+            if delay:
+                await asyncio.sleep(delay)
+            if i == 0:
+                self._maybe_fail()
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -1,14 +1,21 @@
+import argparse
+import asyncio
+import re
+import time
+
 from dotenv import load_dotenv
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+from langchain_core.runnables import RunnableLambda
+
+from llms import get_model
+from streaming import StreamTimer, echo_stream, print_token
+from token_counter import token_model_name
+from tracing import get_tracer
 
 load_dotenv()
 # 1. Define the model
-model = ChatGroq(
-            model="llama-3.1-8b-instant",
-            temperature=0.0
-)
+model = get_model("llama-3.1-8b-instant", temperature=0.0)
 # 2. Define the prompts
 question_prompt = PromptTemplate(
     input_variables=['topic'],
@@ -18,17 +25,85 @@ answer_prompt = PromptTemplate(
     input_variables=['questions'],
     template='Generate answers for the following questions:\n{questions}'
 )
+single_answer_prompt = PromptTemplate(
+    input_variables=['question'],
+    template='Answer the following question:\n{question}'
+)
 # 3. Create the question and answer chains using the pipe operator
 output_parser = StrOutputParser()
 question_chain = question_prompt | model |  output_parser
 answer_chain = answer_prompt | model | output_parser
+single_answer_chain = single_answer_prompt | model | output_parser
 
 def build_answer_input_from_questions(questions: str) -> dict:
     return {'questions': questions}
 
-# 4. Combine the chains into a full chain
-full_chain = question_chain | build_answer_input_from_questions |  answer_chain
-# 5. Invoke the full chain with a specific topic, and print the response
-response = full_chain.invoke({'topic': 'Kerala is the best place to visit in India'})
-print('ANSWERS:\n')
-print(response)
+def parse_questions(text: str) -> list[str]:
+    """Splits the question chain output into individual questions, dropping numbering and bullets."""
+    lines = [re.sub(r'^\s*(?:\d+[.)]|[-*•])\s*', '', line).strip() for line in text.splitlines()]
+    questions = [line for line in lines if line.endswith('?')]
+    return questions or [line for line in lines if line]
+
+async def answer_questions(questions: list[str], max_concurrency: int) -> list[dict]:
+    """Answers each question with its own LLM call, at most max_concurrency at a time.
+
+    abatch returns the answers in question order, whatever order the calls complete in.
+    """
+    answers = await single_answer_chain.abatch(
+        [{'question': question} for question in questions],
+        config={'max_concurrency': max_concurrency}
+    )
+    return [{'question': question, 'answer': answer} for question, answer in zip(questions, answers)]
+
+def format_answers(pairs: list[dict]) -> str:
+    return '\n\n'.join(f"{i}. {pair['question']}\n{pair['answer']}" for i, pair in enumerate(pairs, start=1))
+
+# 4. Combine the chains into a full chain. The questions are printed while they stream through echo_stream
+# and collected once as the answer chain's input, which starts as soon as the question stage completes.
+full_chain = question_chain | echo_stream | build_answer_input_from_questions |  answer_chain
+
+def build_fan_out_chain(max_concurrency: int):
+    """Chain that answers every generated question concurrently instead of in one long generation."""
+    async def answer_all(questions: list[str]) -> list[dict]:
+        return await answer_questions(questions, max_concurrency)
+    return question_chain | parse_questions | RunnableLambda(answer_all) | format_answers
+
+def run_streaming(topic: str) -> None:
+    """Streams the full chain, printing the answers as they are generated."""
+    timer = StreamTimer(token_model_name(model))
+    print('QUESTIONS:\n')
+    for i, chunk in enumerate(full_chain.stream({'topic': topic}, config={'callbacks': [timer]})):
+        if i == 0:
+            print('\n\nANSWERS:\n')
+        print_token(chunk)
+    print('\n')
+    for stage, stats in zip(['Questions', 'Answers'], timer.calls):
+        print(f'⏱️ {stage}: {stats}')
+
+def run_fan_out(topic: str, max_concurrency: int) -> None:
+    """Answers the generated questions concurrently and prints them in question order."""
+    timer = StreamTimer(token_model_name(model))
+    started = time.perf_counter()
+    response = asyncio.run(build_fan_out_chain(max_concurrency).ainvoke({'topic': topic}, config={'callbacks': [timer]}))
+    wall_time = time.perf_counter() - started
+    print('ANSWERS:\n')
+    print(response)
+    print()
+    question_stats, answer_stats = timer.calls[0], timer.calls[1:]
+    print(f'⏱️ Questions: {question_stats}')
+    if answer_stats:
+        print(f'⏱️ {len(answer_stats)} answers: slowest {max(stats.total_s for stats in answer_stats):.2f}s, '
+              f'sum {sum(stats.total_s for stats in answer_stats):.2f}s')
+    print(f'⏱️ Wall time: {wall_time:.2f}s (max concurrency {max_concurrency})')
+
+# 5. Run the chain with a specific topic
+parser = argparse.ArgumentParser(description='Generate questions about a topic and answer them.')
+parser.add_argument('--fan-out', action='store_true', help='Answer each generated question concurrently.')
+parser.add_argument('--concurrency', type=int, default=5, help='Max concurrent answer calls in fan-out mode.')
+args = parser.parse_args()
+if args.fan_out:
+    run_fan_out('Kerala is the best place to visit in India', args.concurrency)
+else:
+    run_streaming('Kerala is the best place to visit in India')
+if latency_table := get_tracer().format_summary():
+    print(latency_table)
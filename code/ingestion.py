@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections.abc import Iterator
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chunking import create_splitter
+from embedding_cache import get_embeddings
+from paths import CHROMA_DIR, DATA_DIR, INGESTION_MANIFEST_FPATH
+
+COLLECTION_NAME = "documents"
+SUPPORTED_EXTENSIONS = (".md", ".txt")
+READ_BLOCK_SIZE = 64 * 1024
+EMBEDDING_BATCH_SIZE = 64
+
+
+def iter_files(root_dir: str) -> Iterator[str]:
+    """Yields the paths of all supported text files below a directory, in a stable order."""
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(dir_path, file_name)
+
+
+def file_sha256(file_path: str) -> str:
+    """Hashes a file in fixed-size blocks without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(READ_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_chunks(file_path: str, splitter: RecursiveCharacterTextSplitter) -> Iterator[str]:
+    """Streams a file and yields its chunks as soon as they are complete.
+
+    The file is read in blocks; everything but the last chunk of the buffer is emitted and the last
+    chunk is carried over, so memory use is bounded by the block size rather than the file size.
+    """
+    buffer = ""
+    with open(file_path, "r", encoding="utf-8") as f:
+        while block := f.read(READ_BLOCK_SIZE):
+            buffer += block
+            chunks = splitter.split_text(buffer)
+            if len(chunks) > 1:
+                yield from chunks[:-1]
+                buffer = chunks[-1]
+    if buffer.strip():
+        yield from splitter.split_text(buffer)
+
+
+def chunk_ids(file_path: str, count: int, start: int = 0) -> list[str]:
+    """Returns the stable vector store ids of a file's chunks `start` to `count`."""
+    prefix = hashlib.sha1(file_path.encode("utf-8")).hexdigest()
+    return [f"{prefix}:{i}" for i in range(start, count)]
+
+
+def load_manifest() -> dict:
+    """Loads the record of previously ingested files."""
+    if not os.path.exists(INGESTION_MANIFEST_FPATH):
+        return {}
+    with open(INGESTION_MANIFEST_FPATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict) -> None:
+    """Saves the record of ingested files, replacing the previous one atomically."""
+    os.makedirs(os.path.dirname(INGESTION_MANIFEST_FPATH), exist_ok=True)
+    tmp_path = f"{INGESTION_MANIFEST_FPATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, INGESTION_MANIFEST_FPATH)
+
+
+def open_vector_store(embeddings: Embeddings | None = None) -> VectorStore:
+    """Opens the persistent Chroma collection that the ingestion pipeline writes to."""
+    from langchain_community.vectorstores import Chroma
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=embeddings or get_embeddings(),
+        persist_directory=CHROMA_DIR,
+    )
+
+
+def ingest_file(file_path: str, vector_store: VectorStore, splitter: RecursiveCharacterTextSplitter,
+                batch_size: int = EMBEDDING_BATCH_SIZE) -> int:
+    """Chunks a file and upserts its chunks into the vector store in fixed-size batches.
+
+    Returns:
+        The number of chunks written.
+    """
+    batch: list[Document] = []
+    count = 0
+    for chunk in iter_chunks(file_path, splitter):
+        batch.append(Document(page_content=chunk, metadata={"source": file_path, "chunk_id": count}))
+        count += 1
+        if len(batch) == batch_size:
+            vector_store.add_documents(batch, ids=chunk_ids(file_path, count, start=count - len(batch)))
+            batch = []
+    if batch:
+        vector_store.add_documents(batch, ids=chunk_ids(file_path, count, start=count - len(batch)))
+    return count
+
+
+def ingest_directory(root_dir: str = DATA_DIR, batch_size: int = EMBEDDING_BATCH_SIZE, workers: int = 0) -> dict:
+    """Incrementally ingests every supported file below a directory into the persistent vector store.
+
+    Files whose size and mtime (or, failing that, content hash) are unchanged since the last run are
+    skipped. Changed files have their old chunks replaced, and chunks of files that no longer exist
+    are deleted.
+
+    Args:
+        root_dir: Directory to walk.
+        batch_size: Number of chunks embedded and written per batch.
+        workers: Number of embedding worker processes; 0 or 1 embeds in this process.
+
+    Returns:
+        Ingestion statistics.
+    """
+    manifest = load_manifest()
+    vector_store = open_vector_store(get_embeddings(workers=workers))
+    splitter = create_splitter()
+    stats = {"files_ingested": 0, "files_skipped": 0, "files_removed": 0, "chunks": 0}
+    started = time.perf_counter()
+
+    seen = set()
+    for file_path in iter_files(root_dir):
+        seen.add(file_path)
+        file_stat = os.stat(file_path)
+        previous = manifest.get(file_path)
+        if previous and previous["size"] == file_stat.st_size and previous["mtime"] == file_stat.st_mtime:
+            stats["files_skipped"] += 1
+            continue
+        sha256 = file_sha256(file_path)
+        if previous and previous["sha256"] == sha256:
+            previous["mtime"] = file_stat.st_mtime
+            stats["files_skipped"] += 1
+            continue
+
+        if previous and previous["chunks"]:
+            vector_store.delete(ids=chunk_ids(file_path, previous["chunks"]))
+        count = ingest_file(file_path, vector_store, splitter, batch_size)
+        manifest[file_path] = {"size": file_stat.st_size, "mtime": file_stat.st_mtime, "sha256": sha256,
+                               "chunks": count}
+        save_manifest(manifest)
+        stats["files_ingested"] += 1
+        stats["chunks"] += count
+        print(f"  ✓ Ingested {file_path} ({count} chunks)")
+
+    for file_path in [path for path in manifest if path not in seen]:
+        if removed_chunks := manifest.pop(file_path)["chunks"]:
+            vector_store.delete(ids=chunk_ids(file_path, removed_chunks))
+        stats["files_removed"] += 1
+        print(f"  🗑️ Removed chunks of deleted file {file_path}")
+    save_manifest(manifest)
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_s"] = elapsed
+    stats["documents_per_s"] = stats["files_ingested"] / elapsed if elapsed else 0.0
+    stats["chunks_per_s"] = stats["chunks"] / elapsed if elapsed else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Ingest the data directory into the persistent vector store.")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Chunks embedded per batch.")
+    parser.add_argument("--workers", type=int, default=0, help="Embedding worker processes (0 = in-process).")
+    args = parser.parse_args()
+    print(f"Ingesting files from {DATA_DIR}...")
+    result = ingest_directory(batch_size=args.batch_size, workers=args.workers)
+    print(f"✓ Ingested {result['files_ingested']} files ({result['chunks']} chunks), "
+          f"skipped {result['files_skipped']} unchanged, removed {result['files_removed']}.")
+    print(f"⏱️ {result['elapsed_s']:.2f}s, {result['documents_per_s']:.2f} documents/sec, "
+          f"{result['chunks_per_s']:.1f} chunks/sec")
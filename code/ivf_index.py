@@ -0,0 +1,381 @@
+import json
+import os
+import uuid
+from collections.abc import Iterable
+from typing import Any, Callable
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from numpy_vector_store import normalize_rows
+
+SAVE_BLOCK_ROWS = 65_536
+# Candidates fetched per requested result when a metadata filter is applied after the search
+FILTER_OVERSAMPLING = 4
+
+
+def write_arrays_atomically(file_path: str, arrays: Iterable[np.ndarray]) -> None:
+    """Writes arrays back to back as raw bytes to a temporary file, then moves it into place."""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for array in arrays:
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, file_path)
+
+
+def matches_filter(metadata: dict, filter: dict | None) -> bool:
+    """Returns True if metadata passes a filter in the format of NumpyVectorStore.filter_mask: metadata
+    keys mapped to a value or a list of accepted values, combined with AND."""
+    for key, accepted in (filter or {}).items():
+        values = accepted if isinstance(accepted, (list, tuple, set)) else [accepted]
+        if metadata.get(key) not in values:
+            return False
+    return True
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the column indices and values of the k highest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=np.float32)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class IVFIndex:
+    """Inverted-file (IVF) approximate nearest neighbour index over normalized float32 vectors.
+
+    Vectors are clustered around `n_lists` centroids with spherical k-means; a query is compared
+    only with the vectors of its `n_probe` closest lists. Raising `n_probe` trades latency for
+    recall. Until the index is trained (automatically once `min_train_size` vectors have been
+    added), searches are exact.
+
+    A saved index is opened with memory maps, so loading does not read the vectors; vectors added
+    after loading are kept in memory until the next save.
+    """
+
+    def __init__(self, dim: int, n_lists: int = 256, n_probe: int = 8, min_train_size: int | None = None):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size if min_train_size is not None else n_lists * 39
+        self.centroids: np.ndarray | None = None
+        # Rows [0, base_size) live in `_base` (possibly memory-mapped), the rest in `_delta`
+        self._base = np.empty((0, dim), dtype=np.float32)
+        self._delta = np.empty((1024, dim), dtype=np.float32)
+        self._delta_size = 0
+        # Row ids per list, as a list of array segments so that inserts only append
+        self._lists: list[list[np.ndarray]] = []
+
+    @property
+    def size(self) -> int:
+        return len(self._base) + self._delta_size
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Gathers the vectors of the given row ids."""
+        rows = np.asarray(rows, dtype=np.int64)
+        base_size = len(self._base)
+        if self._delta_size == 0:
+            return np.asarray(self._base[rows])
+        in_base = rows < base_size
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        out[in_base] = self._base[rows[in_base]]
+        out[~in_base] = self._delta[rows[~in_base] - base_size]
+        return out
+
+    def iter_blocks(self, block_rows: int = SAVE_BLOCK_ROWS) -> Iterable[np.ndarray]:
+        """Yields all vectors in row order, in blocks."""
+        for start in range(0, len(self._base), block_rows):
+            yield np.asarray(self._base[start:start + block_rows])
+        if self._delta_size:
+            yield self._delta[:self._delta_size]
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Adds vectors (normalized here) and returns their row ids."""
+        vectors = normalize_rows(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        start = self.size
+        needed = self._delta_size + len(vectors)
+        if needed > len(self._delta):
+            grown = np.empty((max(needed, 2 * len(self._delta)), self.dim), dtype=np.float32)
+            grown[:self._delta_size] = self._delta[:self._delta_size]
+            self._delta = grown
+        self._delta[self._delta_size:needed] = vectors
+        self._delta_size = needed
+        rows = np.arange(start, start + len(vectors))
+
+        if self.trained:
+            self._assign(rows, vectors)
+        elif self.size >= self.min_train_size:
+            self.train()
+        return rows
+
+    def _assign(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Appends rows to the list of their nearest centroid."""
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        for list_id, segment in enumerate(np.split(rows[order], np.cumsum(counts)[:-1])):
+            if len(segment):
+                self._lists[list_id].append(segment)
+
+    def train(self, iterations: int = 10, sample_size: int | None = None, seed: int = 0) -> None:
+        """Clusters the stored vectors with spherical k-means and assigns every row to a list.
+
+        Args:
+            iterations: k-means iterations.
+            sample_size: Number of vectors used to fit the centroids (default 64 per list).
+            seed: Random seed for sampling and initialization.
+        """
+        rng = np.random.default_rng(seed)
+        n_lists = min(self.n_lists, self.size)
+        sample_size = min(sample_size or n_lists * 64, self.size)
+        sample = self.vectors(np.sort(rng.choice(self.size, size=sample_size, replace=False)))
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        self.n_lists = n_lists
+        self.centroids = centroids.astype(np.float32)
+        self._lists = [[] for _ in range(n_lists)]
+        start = 0
+        for block in self.iter_blocks():
+            self._assign(np.arange(start, start + len(block)), block)
+            start += len(block)
+
+    def exact_search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Brute-force top-k over all vectors, scanning them in blocks."""
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        start = 0
+        for block in self.iter_blocks():
+            block_top, block_scores = top_k(queries @ block.T, k)
+            rows = np.concatenate([best_rows, block_top + start], axis=1)
+            scores = np.concatenate([best_scores, block_scores], axis=1)
+            keep, best_scores = top_k(scores, k)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            start += len(block)
+        return best_rows, best_scores
+
+    def search(self, queries: np.ndarray, k: int, n_probe: int | None = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Approximate top-k search.
+
+        Args:
+            queries: Query vectors, one per row.
+            k: Number of results per query.
+            n_probe: Number of lists scanned per query; defaults to the index setting.
+
+        Returns:
+            One (row ids, cosine similarities) pair per query, best first.
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if not self.trained:
+            rows, scores = self.exact_search(queries, k)
+            return list(zip(rows, scores))
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probes, _ = top_k(queries @ self.centroids.T, n_probe)
+        results = []
+        for query, query_probes in zip(queries, probes):
+            segments = [segment for list_id in query_probes for segment in self._lists[list_id]]
+            if not segments:
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            candidates = np.concatenate(segments)
+            cols, scores = top_k((self.vectors(candidates) @ query)[None, :], k)
+            results.append((candidates[cols[0]], scores[0]))
+        return results
+
+    def save(self, index_dir: str) -> None:
+        """Writes the index to a directory. Files are replaced atomically, so an index that is
+        currently memory-mapped from the same directory can be saved over safely."""
+        os.makedirs(index_dir, exist_ok=True)
+
+        def write(name: str, arrays: Iterable[np.ndarray]) -> None:
+            write_arrays_atomically(os.path.join(index_dir, name), arrays)
+
+        write("vectors.f32", self.iter_blocks())
+        if self.trained:
+            list_rows = [np.concatenate(segments) if segments else np.empty(0, dtype=np.int64)
+                         for segments in self._lists]
+            offsets = np.concatenate([[0], np.cumsum([len(rows) for rows in list_rows])]).astype(np.int64)
+            write("centroids.f32", [self.centroids])
+            write("list_rows.i64", [rows.astype(np.int64) for rows in list_rows])
+            write("list_offsets.i64", [offsets])
+        meta = {"dim": self.dim, "n_lists": self.n_lists, "n_probe": self.n_probe, "size": self.size,
+                "trained": self.trained, "min_train_size": self.min_train_size}
+        with open(os.path.join(index_dir, "meta.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(index_dir, "meta.json.tmp"), os.path.join(index_dir, "meta.json"))
+
+    @classmethod
+    def load(cls, index_dir: str) -> "IVFIndex":
+        """Opens a saved index with memory maps; vectors and list rows are paged in on demand."""
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(meta["dim"], n_lists=meta["n_lists"], n_probe=meta["n_probe"],
+                    min_train_size=meta["min_train_size"])
+        if meta["size"]:
+            index._base = np.memmap(os.path.join(index_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                                    shape=(meta["size"], meta["dim"]))
+        if meta["trained"]:
+            index.centroids = np.fromfile(os.path.join(index_dir, "centroids.f32"),
+                                          dtype=np.float32).reshape(meta["n_lists"], meta["dim"])
+            offsets = np.fromfile(os.path.join(index_dir, "list_offsets.i64"), dtype=np.int64)
+            list_rows = (np.memmap(os.path.join(index_dir, "list_rows.i64"), dtype=np.int64, mode="r")
+                         if offsets[-1] else np.empty(0, dtype=np.int64))
+            index._lists = [[list_rows[offsets[i]:offsets[i + 1]]] for i in range(meta["n_lists"])]
+        return index
+
+
+class IVFVectorStore(VectorStore):
+    """LangChain vector store on top of an IVFIndex, for corpora too large for brute-force search.
+
+    Documents of a loaded store are read lazily from a JSON-lines file using a memory-mapped
+    offset table, so opening a store costs the same regardless of its size.
+    """
+
+    def __init__(self, embedding: Embeddings, n_lists: int = 256, n_probe: int = 8, index: IVFIndex | None = None):
+        self.embedding = embedding
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.index = index
+        self._documents: list[tuple[str, Document]] = []
+        self._docs_path: str | None = None
+        self._doc_offsets = np.empty(0, dtype=np.int64)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def _base_documents(self) -> int:
+        return max(len(self._doc_offsets) - 1, 0)
+
+    def _read_line(self, row: int) -> dict:
+        """Reads the stored JSON record of a document of the loaded store."""
+        with open(self._docs_path, "rb") as f:
+            f.seek(int(self._doc_offsets[row]))
+            return json.loads(f.read(int(self._doc_offsets[row + 1] - self._doc_offsets[row])))
+
+    def document(self, row: int) -> Document:
+        """Returns the document stored at a row."""
+        if row < self._base_documents:
+            record = self._read_line(row)
+            return Document(page_content=record["page_content"], metadata=record["metadata"])
+        return self._documents[row - self._base_documents][1]
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, *,
+                  ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        if self.index is None:
+            self.index = IVFIndex(vectors.shape[1], n_lists=self.n_lists, n_probe=self.n_probe)
+        self.index.add(vectors)
+        self._documents.extend(
+            (doc_id, Document(page_content=text, metadata=metadata))
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        )
+        return ids
+
+    def search_by_vectors(self, query_vectors: np.ndarray, k: int = 4, n_probe: int | None = None,
+                          filter: dict | None = None) -> list[list[tuple[Document, float]]]:
+        """Returns the approximate top-k documents and cosine similarities for each query vector.
+
+        A metadata filter (see `matches_filter`) is applied to the candidates of the probed lists, which
+        are fetched in growing batches until k of them match or the probed lists are exhausted.
+        """
+        if self.index is None:
+            return [[] for _ in np.atleast_2d(query_vectors)]
+        if not filter:
+            return [
+                [(self.document(int(row)), float(score)) for row, score in zip(rows, scores)]
+                for rows, scores in self.index.search(query_vectors, k, n_probe=n_probe)
+            ]
+        results = []
+        for query in np.atleast_2d(query_vectors):
+            candidates = k * FILTER_OVERSAMPLING
+            while True:
+                rows, scores = self.index.search(query, candidates, n_probe=n_probe)[0]
+                matched = [(document, float(score)) for row, score in zip(rows, scores)
+                           if matches_filter((document := self.document(int(row))).metadata, filter)]
+                if len(matched) >= k or len(rows) < candidates:
+                    break
+                candidates *= FILTER_OVERSAMPLING
+            results.append(matched[:k])
+        return results
+
+    def batch_similarity_search_with_score(self, queries: list[str], k: int = 4, n_probe: int | None = None,
+                                           filter: dict | None = None) -> list[list[tuple[Document, float]]]:
+        """Runs several text queries at once."""
+        return self.search_by_vectors(np.asarray(self.embedding.embed_documents(queries)), k=k, n_probe=n_probe,
+                                      filter=filter)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, n_probe: int | None = None,
+                                     filter: dict | None = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.search_by_vectors(np.asarray([self.embedding.embed_query(query)]), k=k, n_probe=n_probe,
+                                      filter=filter)[0]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, filter: dict | None = None,
+                                    **kwargs: Any) -> list[Document]:
+        return [document for document, _ in self.search_by_vectors(np.asarray([embedding]), k=k, filter=filter)[0]]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k=k, filter=filter, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity in [-1, 1] mapped to a relevance score in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def save(self, store_dir: str) -> None:
+        """Saves the index and documents so the store can be reopened with `load`."""
+        if self.index is None:
+            raise ValueError("Cannot save an empty store")
+        self.index.save(store_dir)
+        tmp_path = os.path.join(store_dir, "documents.jsonl.tmp")
+        offsets = [0]
+        with open(tmp_path, "wb") as f:
+            if self._base_documents:
+                with open(self._docs_path, "rb") as base:
+                    while block := base.read(1 << 20):
+                        f.write(block)
+                offsets.extend(int(offset) for offset in self._doc_offsets[1:])
+            for doc_id, document in self._documents:
+                line = json.dumps({"id": doc_id, "page_content": document.page_content,
+                                   "metadata": document.metadata}, ensure_ascii=False).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        os.replace(tmp_path, os.path.join(store_dir, "documents.jsonl"))
+        write_arrays_atomically(os.path.join(store_dir, "document_offsets.i64"), [np.asarray(offsets, dtype=np.int64)])
+
+    @classmethod
+    def load(cls, store_dir: str, embedding: Embeddings, n_probe: int | None = None) -> "IVFVectorStore":
+        """Opens a saved store with memory maps, without reading the vectors or documents."""
+        index = IVFIndex.load(store_dir)
+        if n_probe:
+            index.n_probe = n_probe
+        store = cls(embedding, n_lists=index.n_lists, n_probe=index.n_probe, index=index)
+        store._docs_path = os.path.join(store_dir, "documents.jsonl")
+        store._doc_offsets = np.memmap(os.path.join(store_dir, "document_offsets.i64"), dtype=np.int64, mode="r")
+        return store
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: list[dict] | None = None, *,
+                   ids: list[str] | None = None, **kwargs: Any) -> "IVFVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
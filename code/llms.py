@@ -1,47 +1,187 @@
+import asyncio
+import hashlib
 import os
+import threading
+import weakref
+from functools import lru_cache
 
+import httpx
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from rate_limiter import ScheduledChatModel, get_scheduler
+from response_cache import get_response_cache
+from tracing import get_tracing_handler, tracing_enabled
 
 load_dotenv()
-available_models = [
-    "gpt-4o-mini",
-    "gemini-1.5-flash",
-    "gemini-1.5-pro",
-    "llama-3.1-8b-instant",
-    "llama-3.3-70b-versatile",
-    "qwen/qwen3-32b",
-    "openai/gpt-oss-20b",
-]
-
-
-def get_model(model: str):
-    if model not in available_models:
-        raise ValueError(f"Invalid model. Available models: {available_models.keys()}")
-
-    if model == "gpt-4o-mini":
+MODEL_PROVIDERS = {
+    "gpt-4o-mini": "openai",
+    "gemini-1.5-flash": "google",
+    "gemini-1.5-pro": "google",
+    "llama-3.1-8b-instant": "groq",
+    "llama-3.3-70b-versatile": "groq",
+    "qwen/qwen3-32b": "groq",
+    "openai/gpt-oss-20b": "groq",
+}
+available_models = list(MODEL_PROVIDERS)
+
+HTTP_TIMEOUT_SECONDS = 60.0
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+
+# One client per (provider, model, temperature, cached), shared by every caller in the process
+_model_registry: dict[tuple[str, str, float, bool], BaseChatModel] = {}
+_registry_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """Returns the process-wide pooled HTTP client, so TCP/TLS connections are kept alive and reused."""
+    return httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT_SECONDS)
+
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """Async HTTP client that sends every request through a pooled client of the running event loop.
+
+    Pooled connections belong to the event loop that opened them, while chat models (and this client)
+    are shared by the whole process, e.g. across successive asyncio.run calls. Each loop therefore
+    gets its own connection pool, which is dropped with the loop.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient] = \
+            weakref.WeakKeyDictionary()
+        self._clients_lock = threading.Lock()
+
+    def _loop_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            if (client := self._clients.get(loop)) is None:
+                # Pools of closed loops cannot be used or closed anymore; let them be garbage collected
+                for closed_loop in [other for other in self._clients if other.is_closed()]:
+                    del self._clients[closed_loop]
+                client = self._clients[loop] = httpx.AsyncClient(**self._client_kwargs)
+            return client
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await self._loop_client().send(request, **kwargs)
+
+    async def aclose(self) -> None:
+        """Closes the connection pool of the running loop."""
+        with self._clients_lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    """Returns the process-wide async HTTP client used by ainvoke/abatch calls, pooled per event loop."""
+    return LoopLocalAsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT_SECONDS)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Returns True if a provider error means the request was rate limited (HTTP 429)."""
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 429 or "RateLimit" in type(error).__name__ or "ResourceExhausted" in type(error).__name__
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """Returns the delay requested by a rate-limited response's Retry-After header, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def prefix_cache_kwargs(llm: BaseChatModel, prefix: str) -> dict:
+    """Returns invoke kwargs that mark a stable prompt prefix for provider-side prompt caching.
+
+    OpenAI caches prompt prefixes automatically but routes requests sharing a `prompt_cache_key` to the same
+    cache, which raises the hit rate. Groq and Gemini cache implicitly and take no extra parameters.
+    """
+    if llm._llm_type == "openai-chat":
+        return {"prompt_cache_key": hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:32]}
+    return {}
+
+
+def prompt_cache_usage(response) -> tuple[int | None, int | None]:
+    """Returns the provider-reported (prompt tokens, cached prompt tokens) of a response, or (None, None)."""
+    if usage := getattr(response, "usage_metadata", None):
+        return usage.get("input_tokens"), usage.get("input_token_details", {}).get("cache_read", 0)
+    token_usage = getattr(response, "response_metadata", {}).get("token_usage") or {}
+    if "prompt_tokens" in token_usage:
+        details = token_usage.get("prompt_tokens_details") or {}
+        return token_usage["prompt_tokens"], details.get("cached_tokens", 0)
+    return None, None
+
+
+def create_model(provider: str, model: str, temperature: float) -> BaseChatModel:
+    """Creates a new chat model client for a provider. Prefer get_model, which reuses clients.
+
+    Provider packages are imported here, on first use, so that importing this module stays fast and only
+    the providers actually used are loaded.
+    """
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
         return ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.0,
+            model=model,
+            temperature=temperature,
             api_key=os.getenv("OPENAI_API_KEY"),
+            # Report token usage (including cached prompt tokens) in the last chunk of streamed responses
+            stream_usage=True,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
         )
-    elif model in ["gemini-1.5-flash", "gemini-1.5-pro"]:
+    elif provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        # The Gemini SDK manages its own connection pool per client instance
         return ChatGoogleGenerativeAI(
             model=model,
-            temperature=0.0,
+            temperature=temperature,
             api_key=os.getenv("GOOGLE_API_KEY"),
         )
-
-    elif model in [
-        "llama-3.1-8b-instant",
-        "llama-3.3-70b-versatile",
-        "qwen/qwen3-32b",
-        "openai/gpt-oss-20b",
-    ]:
+    elif provider == "groq":
+        from langchain_groq import ChatGroq
         return ChatGroq(
             model=model,
-            temperature=0.0,
+            temperature=temperature,
             api_key=os.getenv("GROQ_API_KEY"),
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
         )
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def get_model(model: str, temperature: float = 0.0, use_cache: bool = False) -> BaseChatModel:
+    """Returns the shared chat model client for a model and temperature, creating it on first use.
+
+    Args:
+        model: One of `available_models`.
+        temperature: Sampling temperature.
+        use_cache: Serve repeated requests from the local response cache. Only applies at temperature 0,
+            where identical requests are expected to produce identical responses.
+
+    Returns:
+        A chat model whose HTTP connections are pooled with every other client in the process. If the
+        `rate_limits` config covers the model's provider, requests also go through the shared scheduler.
+        If `tracing` is enabled, every call is recorded by the shared tracing callback handler.
+    """
+    if model not in MODEL_PROVIDERS:
+        raise ValueError(f"Invalid model. Available models: {available_models}")
+
+    cached = use_cache and temperature == 0
+    key = (MODEL_PROVIDERS[model], model, float(temperature), cached)
+    with _registry_lock:
+        if key not in _model_registry:
+            llm = create_model(*key[:3])
+            if (scheduler := get_scheduler()).limits(key[0]):
+                llm = ScheduledChatModel(model=llm, provider=key[0], scheduler=scheduler)
+            if cached:
+                llm.cache = get_response_cache()
+            if tracing_enabled():
+                llm.callbacks = [get_tracing_handler()]
+            _model_registry[key] = llm
+        return _model_registry[key]
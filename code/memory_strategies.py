@@ -1,98 +1,93 @@
+import argparse
+import asyncio
+import importlib.util
 import os
+import statistics
+import sys
+import time
 
-import tiktoken
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_groq import ChatGroq
-
-from constants import PUBLICATION_CONTENT_HEADER, PUBLICATION_CONTENT_FOOTER
-from prompt_builder import load_system_prompts
-from paths import APP_CONFIG_FPATH, DATA_DIR, OUTPUTS_DIR
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import RunnableLambda
+
+from constants import PUBLICATION_CONTENT_HEADER
+from conversation_log import ConversationLog
+from fake_llms import FakeChatModel
+from prompt_builder import build_publication_excerpt, format_publication_section, load_system_prompts
+from report_writer import StrategyReportWriter
+from embedding_cache import get_embeddings
+from paths import APP_CONFIG_FPATH, CONVERSATION_LOG_DIR, DATA_DIR, OUTPUTS_DIR
 from file_utils import load_yaml, save_text_to_file
+from model_router import ModelRouter, get_router
+from llms import get_model, is_rate_limit_error, prefix_cache_kwargs, prompt_cache_usage, retry_after_seconds
+from rate_limiter import Priority, ScheduledChatModel, get_scheduler, request_priority
+from retrieval_memory import RetrievalMemory
+from streaming import astream_chat, stream_chat
 from str_utils import capitalize_first_char
-
-
-def save_strategy_results(strategy: str, qa_pairs: list[dict], final_prompt: str, final_response: str, token_progression: list, questions: list) -> None:
-    """Saves the results of a memory strategy run to output files."""
-    content = [f"# {strategy.upper()} STRATEGY RESULTS", "=" * 60, ""]
-
-    # Strategy description
-    descriptions = {
-        "stuffing": "Keeps ALL previous messages in conversation history.",
-        "trimming": "Keeps only the most recent N messages in conversation history.",
-        "summarization": "Summarizes older messages and keeps recent messages for context."
+from summarizer import RollingSummarizer
+from token_counter import get_token_counter, strip_publication, token_model_name
+from tracing import get_tracer, get_tracing_handler, trace_stage, tracing_enabled
+
+PUBLICATION_EXTERNAL_ID = "yzN0OCQT7hUS"
+# Packages the retrieval strategy needs for its Chroma index and HuggingFace embeddings
+RETRIEVAL_PACKAGES = ("langchain_community", "chromadb", "langchain_huggingface")
+
+
+def prompt_cache_stats(response) -> dict:
+    """Returns the cached and uncached prompt tokens reported by the provider for a response."""
+    provider_prompt_tokens, cached_tokens = prompt_cache_usage(response)
+    if provider_prompt_tokens is None:
+        return {'cached_prompt_tokens': None, 'uncached_prompt_tokens': None}
+    return {
+        'cached_prompt_tokens': cached_tokens,
+        'uncached_prompt_tokens': provider_prompt_tokens - cached_tokens
     }
 
-    content.append("## Strategy Description")
-    content.append(descriptions.get(strategy, "Unknown strategy"))
-    content.append("")
-
-    # Token progression
-    content.append("## Token Usage Progression")
-    content.append("| Question | Prompt Tokens | Response Tokens | Total |")
-    content.append("|----------|---------------|-----------------|-------|")
-    for token_data in token_progression:
-        content.append(f"| {token_data['question_num']} | {token_data['prompt_tokens']:,} | {token_data['response_tokens']:,} | {token_data['total_tokens']:,} |")
-    content.append("")
+def open_report_writer(strategy: str, qa_pairs: list[dict] = (), token_progression: list[dict] = ()) -> StrategyReportWriter:
+    """Opens the incremental results report of a strategy run, with the configured token sidecar. Results that
+    already exist (e.g. restored from the conversation log on resume) are written first."""
+    return StrategyReportWriter(
+        strategy,
+        sidecar=memory_cfg.get("report_sidecar"),
+        flush_every=memory_cfg.get("report_flush_every", 1),
+        qa_pairs=qa_pairs,
+        token_rows=token_progression
+    )
 
-    # Final prompt
-    if questions:
-        content.append("## Complete Final Prompt for Last Question")
-        content.append(f"**Last Question:** '{questions[-1]}'")
-        content.append("")
-        content.append("```")
-        content.append(final_prompt)
-        content.append("```")
-        content.append("")
-        content.append("**Final Response:**")
-        content.append("```")
-        content.append(final_response)
-        content.append("```")
-        content.append("")
+def finish_report(report: StrategyReportWriter, final_prompt: str, final_response: str, questions: list) -> None:
+    """Completes a results report with the token table and the final prompt for the last question."""
+    report.close(questions[-1] if questions else None, final_prompt, final_response)
+    print(f"    ✓ Results saved to {report.filename}")
 
-    # All Q&A pairs
-    content.append("## All Q&A Pairs")
-    content.append("")
-    for i, qa in enumerate(qa_pairs, 1):
-        content.append(f"### Question {i}")
-        content.append(f"**User:** {qa['question']}")
-        content.append("")
-        content.append(f"**Assistant:** {qa['response']}")
-        content.append("")
-        content.append("-" * 40)
-        content.append("")
-
-    # Save file
-    filename = f"lesson3a_strategy_{strategy}_results.md"
-    save_text_to_file(
-        "\n".join(content),
-        os.path.join(OUTPUTS_DIR, filename),
-        header=f"{strategy.title()} Strategy Results"
-    )
-    print(f"    ✓ Results saved to {filename}")
+def save_strategy_results(strategy: str, qa_pairs: list[dict], final_prompt: str, final_response: str, token_progression: list, questions: list) -> None:
+    """Saves the results of a memory strategy run to output files when all results are available at once, e.g.
+    in batch mode; conversation runs write their report incrementally."""
+    report = open_report_writer(strategy, qa_pairs, token_progression)
+    finish_report(report, final_prompt, final_response, questions)
 
 def count_tokens(text: str) -> int:
     """Estimates the number of tokens in a given text. If the model encoding is not found, falls back to a
     word-based estimate. """
-    try:
-        encoding = tiktoken.encoding_for_model(llm.model_name)
-        return len(encoding.encode(text))
-    except (KeyError, ValueError):
-        return int(len(text.split()) * 1.3) # Fallback estimate
+    return get_token_counter(llm.model_name).count_tokens(text)
+
+def count_tokens_many(texts: list[str]) -> list[int]:
+    """Estimates the number of tokens of each text in one batched pass."""
+    return get_token_counter(llm.model_name).count_tokens_many(texts)
+
+def count_message_tokens(messages: list) -> int:
+    """Estimates the prompt tokens of a list of messages, including the publication content in the system prompt.
+    Per-message counts are cached, so only messages not seen in earlier turns are tokenized."""
+    with trace_stage("token_counting"):
+        return get_token_counter(llm.model_name, include_publication=True).count_messages(messages)
 
 def remove_publication(system_content)-> str:
     """Removes publication content from the system message. If markers are not found, returns original content.
     Else, replaces publication content with a placeholder."""
-    start_marker = PUBLICATION_CONTENT_HEADER
-    end_marker = PUBLICATION_CONTENT_FOOTER
-    start_idx = system_content.find(start_marker)
-    end_idx = system_content.find(start_marker)
-    if start_idx != -1 and end_idx != -1:
-        before_pub = system_content[:start_idx]
-        after_pub = system_content[end_idx + len(end_marker):]
-        return before_pub + "[PUBLICATION CONTENT OMITTED FOR READABILITY]" + after_pub
-    print("⚠️ Publication content markers not found in system message.")
-    return system_content
+    stripped = strip_publication(system_content)
+    if stripped is system_content:
+        print("⚠️ Publication content markers not found in system message.")
+    return stripped
 
 def messages_to_string(messages: list, include_publication: bool = False) -> str:
     """Converts a list of messages to a single string for token counting."""
@@ -113,6 +108,20 @@ def messages_to_string(messages: list, include_publication: bool = False) -> str
             content += f"AI: {message.content}\n\n"
     return content
 
+def add_publication_context(messages: list, question: str) -> list:
+    """If publication retrieval is enabled, inserts the publication chunks relevant to the question right before
+    it. The system prompt then carries no publication, so its prefix stays stable across turns."""
+    retrieval_cfg = app_config.get("publication_retrieval", {})
+    if not retrieval_cfg.get("enabled"):
+        return messages
+    excerpt = build_publication_excerpt(
+        PUBLICATION_EXTERNAL_ID, question,
+        top_k=retrieval_cfg.get("top_k", 4),
+        max_publication_tokens=retrieval_cfg.get("max_tokens", 1500),
+        token_model=token_model_name(llm)
+    )
+    return messages[:-1] + [SystemMessage(content=format_publication_section(excerpt))] + messages[-1:]
+
 def apply_stuffing_strategy(conversation: list) -> list:
     """Strategy 1: Keep all messages."""
     print("Applying stuffing strategy: keeping all messages.")
@@ -127,116 +136,510 @@ def apply_trimming_strategy(conversation: list, window_size: int) -> list:
         return system_msg + conversation[-window_size:]
 
 
-def apply_summarization_strategy(conversation: list, max_tokens: int) -> list:
-    """Strategy 3: Summarize old messages, keep recent ones."""
+def apply_summarization_strategy(conversation: list, max_tokens: int, summarizer: RollingSummarizer) -> list:
+    """Strategy 3: Summarize old messages, keep recent ones. The summary is produced in the background by the
+    summarizer between turns; if none is ready in time, falls back to trimming."""
 
     # If conversation is short, no need to summarize
-    current_tokens = count_tokens(messages_to_string(system_msg + conversation))
+    current_tokens = count_message_tokens(system_msg + conversation)
     if current_tokens <= max_tokens:
         return system_msg + conversation
 
-    # Keep last 6 messages and summarize the rest
-    recent_messages = conversation[-6:] if len(conversation) > 6 else conversation
-    older_messages = conversation[:-6] if len(conversation) > 6 else []
-
-    if not older_messages:
+    if len(conversation) <= summarizer.keep_recent:
         return system_msg + conversation
 
-    # Create summary
-    try:
-        older_text = ""
-        for msg in older_messages:
-            if isinstance(msg, HumanMessage):
-                older_text += f"Q: {msg.content}\n"
-            elif isinstance(msg, AIMessage):
-                older_text += f"AI: {msg.content}\n"
-
-        summary_prompt = f"""Provide a concise summary of this conversation history:{older_text}
-
-Focus on main topics and key information. Keep under 200 words."""
-
-        summary_response = llm.invoke([HumanMessage(content=summary_prompt)])
-        summary_message = SystemMessage(content=f"Summary of earlier conversation: {summary_response.content}")
-
-        return system_msg + [summary_message] + recent_messages
-
-    except Exception as e:
-        print(f"  ⚠️ Summarization failed, using trimming: {e}")
-        return apply_trimming_strategy(conversation, system_prompts, 8)
-
-def apply_strategy(strategy, conversation_history) -> list:
-    """Applies the specified memory strategy to the conversation history."""
-    curr = []
+    summary, covered = summarizer.current()
+    if not summary:
+        print("  ⏳ Summary not ready, using trimming.")
+        return apply_trimming_strategy(conversation, memory_cfg.get("trimming_window_size", 8))
+
+    # Every message not yet folded into the summary is kept, even when the summary lags behind
+    unsummarized = conversation[covered:]
+    summary_message = SystemMessage(content=f"Summary of earlier conversation: {summary}")
+    return system_msg + [summary_message] + unsummarized
+
+def prefetch_summary(conversation: list, summarizer: RollingSummarizer | None) -> None:
+    """Starts a background summary refresh once the conversation nears the summarization token budget, so that
+    the next turn can use a ready summary instead of waiting on the LLM."""
+    if summarizer is None:
+        return
+    max_tokens = memory_cfg.get("summarization_max_tokens", 1000)
+    prefetch_ratio = memory_cfg.get("summarization_prefetch_ratio", 0.8)
+    if count_message_tokens(system_msg + conversation) >= max_tokens * prefetch_ratio:
+        summarizer.schedule(conversation)
+
+def apply_retrieval_strategy(conversation: list, question: str, memory: RetrievalMemory, max_tokens: int,
+                             keep_recent: int) -> list:
+    """Strategy 4: Keep recent messages plus the past Q/A pairs most relevant to the current question, added in
+    order of relevance while the prompt stays within the token budget."""
+    recent_messages = conversation[-keep_recent:] if keep_recent else []
+    first_recent_turn = (len(conversation) - len(recent_messages)) // 2
+    budget = max_tokens - count_message_tokens(system_msg + recent_messages + [HumanMessage(content=question)])
+
+    selected_turns = []
+    for turn in memory.search(question, before_turn=first_recent_turn):
+        past_question, past_answer = memory.turns[turn]
+        turn_messages = [HumanMessage(content=past_question), AIMessage(content=past_answer)]
+        turn_tokens = count_message_tokens(turn_messages)
+        if turn_tokens > budget:
+            continue
+        budget -= turn_tokens
+        selected_turns.append((turn, turn_messages))
+
+    # Retrieved turns are replayed in conversation order
+    retrieved_messages = [message for _, turn_messages in sorted(selected_turns) for message in turn_messages]
+    return system_msg + retrieved_messages + recent_messages
+
+def create_strategy_state(strategy: str) -> RollingSummarizer | RetrievalMemory | None:
+    """Creates the per-conversation state a strategy keeps between turns: the rolling summarizer for
+    summarization, the Q/A index for retrieval, nothing for the others."""
     match strategy:
-        case "stuffing":
-            curr = apply_stuffing_strategy(conversation=conversation_history[:-1])
-        case "trimming":
-            curr = apply_trimming_strategy(
-                conversation=conversation_history[:-1],
-                window_size=memory_cfg.get("trimming_window_size", 8)
-            )
         case "summarization":
-            curr = apply_summarization_strategy(
-                conversation=conversation_history[:-1],
-                max_tokens=memory_cfg.get("summarization_max_tokens", 1000)
+            return RollingSummarizer(
+                llm,
+                keep_recent=memory_cfg.get("summarization_keep_recent", 6),
+                wait_seconds=memory_cfg.get("summarization_wait_seconds", 2.0)
             )
-        case _:
-            raise ValueError(f"Unknown strategy: {strategy}")
-    return curr
+        case "retrieval":
+            return RetrievalMemory(get_embeddings(), top_k=memory_cfg.get("retrieval_top_k", 3))
+    return None
+
+def retrieval_available() -> bool:
+    """Returns True if the packages of the retrieval strategy are installed, without importing them."""
+    return all(importlib.util.find_spec(package) is not None for package in RETRIEVAL_PACKAGES)
+
+def update_strategy_state(state: RollingSummarizer | RetrievalMemory | None, conversation: list) -> None:
+    """Updates the strategy state after a turn has been answered."""
+    if isinstance(state, RollingSummarizer):
+        # Refresh the summary while the user reads the answer
+        prefetch_summary(conversation, state)
+    elif isinstance(state, RetrievalMemory):
+        state.add_turn(question=conversation[-2].content, answer=conversation[-1].content)
+
+def strategy_state_size(state: RollingSummarizer | RetrievalMemory | None) -> int:
+    """Returns the approximate bytes held by a strategy state (0 for strategies without one)."""
+    return state.size() if state is not None else 0
+
+def close_strategy_state(state: RollingSummarizer | RetrievalMemory | None) -> None:
+    """Releases the resources held by a strategy state."""
+    if state is not None:
+        state.close()
+
+def apply_strategy(strategy, conversation_history, state: RollingSummarizer | RetrievalMemory | None = None) -> list:
+    """Applies the specified memory strategy to the conversation history. Its wall time is traced as the
+    `strategy` stage. Without a state, summarization and retrieval use a temporary one closed afterwards."""
+    temporary_state = None
+    if state is None:
+        state = temporary_state = create_strategy_state(strategy)
+    try:
+        return _apply_strategy(strategy, conversation_history, state)
+    finally:
+        close_strategy_state(temporary_state)
+
+def _apply_strategy(strategy, conversation_history, state: RollingSummarizer | RetrievalMemory | None) -> list:
+    with trace_stage("strategy", strategy=strategy):
+        curr = []
+        match strategy:
+            case "stuffing":
+                curr = apply_stuffing_strategy(conversation=conversation_history[:-1])
+            case "trimming":
+                curr = apply_trimming_strategy(
+                    conversation=conversation_history[:-1],
+                    window_size=memory_cfg.get("trimming_window_size", 8)
+                )
+            case "summarization":
+                curr = apply_summarization_strategy(
+                    conversation=conversation_history[:-1],
+                    max_tokens=memory_cfg.get("summarization_max_tokens", 1000),
+                    summarizer=state
+                )
+            case "retrieval":
+                question = next(m.content for m in reversed(conversation_history) if isinstance(m, HumanMessage))
+                curr = apply_retrieval_strategy(
+                    conversation=conversation_history[:-1],
+                    question=question,
+                    memory=state,
+                    max_tokens=memory_cfg.get("retrieval_max_tokens", 1000),
+                    keep_recent=memory_cfg.get("retrieval_keep_recent", 4)
+                )
+            case _:
+                raise ValueError(f"Unknown strategy: {strategy}")
+        # Provider prompt caching only works if every request starts with the same bytes
+        if not curr or curr[0] is not system_msg[0]:
+            raise RuntimeError(f"Strategy '{strategy}' must keep the system prompt as the first, unchanged message")
+        return curr
+
+def build_final_prompt(strategy: str, conversation_history: list, user_questions: list[str],
+                       state: RollingSummarizer | RetrievalMemory | None = None) -> tuple[str, str]:
+    """Builds the final prompt (without publication) and final response for the last question."""
+    if not user_questions:
+        return "", ""
+    final_messages = apply_strategy(strategy, conversation_history, state)
+    final_messages.append(HumanMessage(content=user_questions[-1]))
+    final_prompt = messages_to_string(final_messages, include_publication=False)
+    final_response = conversation_history[-1].content if conversation_history else "No response"
+    return final_prompt, final_response
+
+def open_conversation_log(strategy: str) -> ConversationLog:
+    """Opens the durable log of the interactive conversation run with a strategy."""
+    return ConversationLog(
+        CONVERSATION_LOG_DIR, f"strategy_{strategy}",
+        fsync_batch=memory_cfg.get("log_fsync_batch", 16)
+    )
+
+def restore_conversation(log: ConversationLog, state: RollingSummarizer | RetrievalMemory | None
+                         ) -> tuple[list, list[int | None], list[dict], list[dict], int]:
+    """Rebuilds a logged conversation from its latest snapshot and the entries after it.
 
-def run_conversation_using_memory_strategy(strategy: str, user_questions: list[str]) -> dict:
-    """Runs a conversation using the specified memory strategy and user questions."""
-    max_tokens_before_summarization = memory_cfg.get("summarization_max_tokens", 1000)
+    Returns:
+        The conversation history, the log positions of its messages, all Q/A pairs (including those folded into
+        the snapshot), the token progression and the number of leading messages that were folded into the
+        snapshot (they are not part of the history).
+    """
+    snapshot, recent = log.resume()
+    first_position = len(log) - len(recent)
+    folded = snapshot["folded"] if snapshot else 0
+    # Turns kept after a snapshot may also be in its token progression
+    token_progression = {row["question_num"]: row for row in snapshot["token_progression"]} if snapshot else {}
+    summary, covered = (snapshot["summary"], snapshot["covered"]) if snapshot else ("", 0)
+    conversation_history, message_positions = [], []
+    for position, entry in enumerate(recent, start=first_position):
+        match entry["type"]:
+            case "message":
+                # A question that was logged but not answered was asked again
+                if entry["role"] == "human" and conversation_history and isinstance(conversation_history[-1], HumanMessage):
+                    conversation_history.pop()
+                    message_positions.pop()
+                message_cls = HumanMessage if entry["role"] == "human" else AIMessage
+                conversation_history.append(message_cls(content=entry["content"]))
+                message_positions.append(position)
+            case "tokens":
+                token_progression[entry["question_num"]] = {key: value for key, value in entry.items() if key != "type"}
+            case "summary":
+                summary, covered = entry["summary"], entry["covered"]
+    if conversation_history and isinstance(conversation_history[-1], HumanMessage):
+        conversation_history.pop()
+        message_positions.pop()
+    qa_pairs = [{"question": question.content, "response": answer.content}
+                for question, answer in zip(conversation_history[::2], conversation_history[1::2])]
+    if isinstance(state, RollingSummarizer):
+        state.summary, state.covered = summary, max(covered - folded, 0)
+    elif isinstance(state, RetrievalMemory):
+        for qa in qa_pairs:
+            state.add_turn(question=qa["question"], answer=qa["response"])
+    folded_qa_pairs = snapshot["qa_pairs"] if snapshot else []
+    return conversation_history, message_positions, folded_qa_pairs + qa_pairs, list(token_progression.values()), folded
+
+def compact_conversation_log(log: ConversationLog, state: RollingSummarizer, folded: int, message_positions: list[int | None],
+                             qa_pairs: list[dict], token_progression: list[dict]) -> None:
+    """Folds the log entries of summarized messages into a snapshot of the summary, the Q/A pairs of the folded
+    turns and the token progression.
+
+    Only the turns the summary does not fully cover yet are kept after the snapshot. `message_positions` holds
+    the log position of every message of the conversation history and is updated in place (None once compacted).
+    """
+    summary, covered = state.summary, state.covered
+    # Fold whole turns only, so the kept messages start with a question
+    fold = covered - covered % 2
+    if not summary or not fold or fold >= len(message_positions):
+        return
+    keep_last = len(log) - message_positions[fold]
+    log.compact({"summary": summary, "covered": folded + covered, "folded": folded + fold,
+                 "qa_pairs": qa_pairs[:(folded + fold) // 2], "token_progression": token_progression},
+                keep_last=keep_last)
+    # Kept messages move up to just after the snapshot, which is entry 0
+    shift = message_positions[fold] - 1
+    message_positions[:] = [None if i < fold else position - shift for i, position in enumerate(message_positions)]
+
+def run_conversation_using_memory_strategy(strategy: str, user_questions: list[str], resume: bool = False) -> dict:
+    """Runs a conversation using the specified memory strategy and user questions.
+
+    Every message, token count and summary is appended to a durable per-strategy conversation log, so a run that
+    was interrupted can continue where it stopped with `resume=True`.
+    """
     print(f"\n🔧 Running {strategy.upper()} strategy on {len(user_questions)} questions")
 
-    # Track conversation history (without system prompt)
-    conversation_history = []
-    qa_pairs = []
-    token_progression = []
-    for idx, question in enumerate(user_questions, start=1):
+    state = create_strategy_state(strategy)
+    log = open_conversation_log(strategy)
+    folded = 0
+    if resume and len(log):
+        # Track conversation history (without system prompt) and the log positions of its messages
+        conversation_history, message_positions, qa_pairs, token_progression, folded = restore_conversation(log, state)
+        print(f"  ↩️ Resuming after {(folded + len(conversation_history)) // 2} answered questions")
+    else:
+        log.reset()
+        conversation_history, message_positions, qa_pairs, token_progression = [], [], [], []
+    # On resume, the report of the interrupted run is rebuilt from the log before it is replaced
+    report = open_report_writer(strategy, qa_pairs, token_progression)
+    logged_summary = getattr(state, "summary", "")
+    answered = (folded + len(conversation_history)) // 2
+    for idx, question in enumerate(user_questions[answered:], start=answered + 1):
         print(f"\n❓ Question {idx}/{len(user_questions)}: {capitalize_first_char(question)}?")
         # Add question to conversation history and then apply strategy
         conversation_history.append(HumanMessage(content=question))
-        currrent_messages = apply_strategy(strategy, conversation_history)
+        message_positions.append(log.append("message", role="human", content=question))
+        currrent_messages = apply_strategy(strategy, conversation_history, state)
         # Add current question to current messages
         currrent_messages.append(HumanMessage(content=question))
+        currrent_messages = add_publication_context(currrent_messages, question)
 
         # Count the tokens before invoking LLM
-        prompt_tokens = count_tokens(messages_to_string(currrent_messages))
+        prompt_tokens = count_message_tokens(currrent_messages)
         try:
-            response = llm.invoke(currrent_messages)
+            print(" Answer: ", end="", flush=True)
+            response, stream_stats = stream_chat(llm, currrent_messages, **prefix_cache_kwargs(llm, system_prompts))
             response_tokens = count_tokens(response.content)
             total_tokens = response_tokens + prompt_tokens
-            print(f" Answer: {response.content}")
+            print(f"\n  ⏱️ {stream_stats}")
             conversation_history.append(AIMessage(content=response.content))
+            message_positions.append(log.append("message", role="ai", content=response.content))
             qa_pairs.append({
                 "question": question,
-                "answer": response.content
+                "response": response.content
             })
             token_progression.append({
                 'question_num': idx,
                 'prompt_tokens': prompt_tokens,
                 'response_tokens': response_tokens,
-                'total_tokens': total_tokens
+                'total_tokens': total_tokens,
+                'latency_s': stream_stats.total_s,
+                'ttft_s': stream_stats.ttft_s,
+                **prompt_cache_stats(response)
             })
+            log.append("tokens", **token_progression[-1])
+            report.add_qa(question, response.content, idx)
+            report.add_token_row(token_progression[-1])
             print(f"  🪙 Token count for this interaction: {total_tokens}")
         except Exception as e:
             print(f"  ❌ Error at question {idx}: {e}")
             break
-        # Generate final prompt for the last question
-        final_messages = []
-    if questions:
-        final_messages = apply_strategy(strategy, conversation_history)
-        final_messages.append(HumanMessage(content=questions[-1]))
-        final_prompt = messages_to_string(final_messages, include_publication=False)
-        final_response = conversation_history[-1].content if conversation_history else "No response"
-    else:
-        final_prompt = ""
-        final_response = ""
-    save_strategy_results(strategy, qa_pairs, final_prompt, final_response, token_progression, user_questions)
+        update_strategy_state(state, conversation_history)
+        if isinstance(state, RollingSummarizer) and state.summary != logged_summary:
+            log.append("summary", summary=state.summary, covered=folded + state.covered)
+            logged_summary = state.summary
+            if len(log) > memory_cfg.get("log_compact_after", 200):
+                compact_conversation_log(log, state, folded, message_positions, qa_pairs, token_progression)
+    log.close()
+    # Generate final prompt for the last question
+    final_prompt, final_response = build_final_prompt(strategy, conversation_history, user_questions, state)
+    close_strategy_state(state)
+    finish_report(report, final_prompt, final_response, user_questions)
+    return {"strategy": strategy, "qa_pairs": qa_pairs, "token_progression": token_progression}
+
+async def arun_conversation_using_memory_strategy(strategy: str, user_questions: list[str],
+                                                  semaphore: asyncio.Semaphore) -> dict:
+    """Async variant of run_conversation_using_memory_strategy used by the benchmark. LLM calls are streamed
+    with llm.astream and bounded by the shared semaphore; per-turn latency and time to first token are
+    recorded with the token counts."""
+    print(f"🔧 Benchmarking {strategy.upper()} strategy on {len(user_questions)} questions")
+    conversation_history = []
+    qa_pairs = []
+    token_progression = []
+    state = create_strategy_state(strategy)
+    report = open_report_writer(strategy)
+    started = time.perf_counter()
+    for idx, question in enumerate(user_questions, start=1):
+        conversation_history.append(HumanMessage(content=question))
+        # Strategies may call the LLM themselves (summarization), so keep them off the event loop
+        current_messages = await asyncio.to_thread(apply_strategy, strategy, conversation_history, state)
+        current_messages.append(HumanMessage(content=question))
+        current_messages = await asyncio.to_thread(add_publication_context, current_messages, question)
+        prompt_tokens = count_message_tokens(current_messages)
+        try:
+            async with semaphore:
+                response, stream_stats = await astream_chat(
+                    llm, current_messages, **prefix_cache_kwargs(llm, system_prompts)
+                )
+        except Exception as e:
+            print(f"  ❌ [{strategy}] Error at question {idx}: {e}")
+            break
+        response_tokens = count_tokens(response.content)
+        conversation_history.append(AIMessage(content=response.content))
+        qa_pairs.append({"question": question, "response": response.content})
+        token_progression.append({
+            'question_num': idx,
+            'prompt_tokens': prompt_tokens,
+            'response_tokens': response_tokens,
+            'total_tokens': prompt_tokens + response_tokens,
+            'latency_s': stream_stats.total_s,
+            'ttft_s': stream_stats.ttft_s,
+            **prompt_cache_stats(response)
+        })
+        report.add_qa(question, response.content, idx)
+        report.add_token_row(token_progression[-1])
+        await asyncio.to_thread(update_strategy_state, state, conversation_history)
+    wall_time = time.perf_counter() - started
+
+    final_prompt, final_response = build_final_prompt(strategy, conversation_history, user_questions, state)
+    close_strategy_state(state)
+    finish_report(report, final_prompt, final_response, user_questions)
+    return {
+        "strategy": strategy,
+        "qa_pairs": qa_pairs,
+        "token_progression": token_progression,
+        "wall_time_s": wall_time
+    }
+
+def summarize_benchmark_run(run: dict) -> dict:
+    """Aggregates the per-turn records of a benchmark run into latency, token and throughput figures."""
+    rows = run["token_progression"]
+    latencies = [row["latency_s"] for row in rows]
+    ttfts = [row["ttft_s"] for row in rows]
+    total_tokens = sum(row["total_tokens"] for row in rows)
+    wall_time = run["wall_time_s"] or 1e-9
+    return {
+        "strategy": run["strategy"],
+        "questions": len(rows),
+        "prompt_tokens": sum(row["prompt_tokens"] for row in rows),
+        "response_tokens": sum(row["response_tokens"] for row in rows),
+        "avg_latency_s": statistics.fmean(latencies) if latencies else 0.0,
+        "avg_ttft_s": statistics.fmean(ttfts) if ttfts else 0.0,
+        "p95_latency_s": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else sum(latencies),
+        "wall_time_s": run["wall_time_s"],
+        "questions_per_s": len(rows) / wall_time,
+        "tokens_per_s": total_tokens / wall_time
+    }
+
+def save_benchmark_results(runs: list[dict], concurrency: int) -> None:
+    """Saves a comparison table of all benchmarked strategies next to the per-strategy result files."""
+    summaries = [summarize_benchmark_run(run) for run in runs]
+    content = ["# MEMORY STRATEGY BENCHMARK", "=" * 60, ""]
+    content.append(f"LLM: `{getattr(llm, 'model_name', type(llm).__name__)}`, concurrency limit: {concurrency}")
+    content.append("")
+    content.append("## Strategy Comparison")
+    content.append("| Strategy | Questions | Prompt Tokens | Response Tokens | Avg TTFT (s) | Avg Latency (s) "
+                   "| P95 Latency (s) | Wall Time (s) | Questions/s | Tokens/s |")
+    content.append("|----------|-----------|---------------|-----------------|--------------|-----------------"
+                   "|-----------------|---------------|-------------|----------|")
+    for summary in summaries:
+        content.append(
+            f"| {summary['strategy']} | {summary['questions']} | {summary['prompt_tokens']:,} "
+            f"| {summary['response_tokens']:,} | {summary['avg_ttft_s']:.3f} | {summary['avg_latency_s']:.3f} "
+            f"| {summary['p95_latency_s']:.3f} "
+            f"| {summary['wall_time_s']:.2f} | {summary['questions_per_s']:.2f} | {summary['tokens_per_s']:,.0f} |"
+        )
+    content.append("")
+    if isinstance(llm, ModelRouter):
+        content.append("## Model Routing")
+        content.append(llm.format_stats())
+        content.append("")
+    if rate_limit_table := get_scheduler().format_metrics():
+        content.append("## Rate Limiting")
+        content.append(rate_limit_table)
+        content.append("")
+    if latency_table := get_tracer().format_summary():
+        content.append("## Latency and Token Histograms")
+        content.append(latency_table)
+        content.append("")
+
+    filename = "lesson3a_strategy_benchmark_results.md"
+    save_text_to_file(
+        "\n".join(content),
+        os.path.join(OUTPUTS_DIR, filename),
+        header="Memory Strategy Benchmark Results"
+    )
+    print(f"    ✓ Benchmark comparison saved to {filename}")
+
+async def run_benchmark(user_questions: list[str], concurrency: int) -> list[dict]:
+    """Runs every memory strategy over the same questions concurrently and saves a comparison report."""
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*(
+        arun_conversation_using_memory_strategy(strategy, user_questions, semaphore)
+        for strategy in strategies
+    ), return_exceptions=True)
+    # A failing strategy (e.g. its embedding model cannot be downloaded) must not lose the others' results
+    runs = []
+    for strategy, result in zip(strategies, results):
+        if isinstance(result, Exception):
+            print(f"  ❌ Strategy '{strategy}' failed: {type(result).__name__}: {result}")
+        else:
+            runs.append(result)
+    save_benchmark_results(runs, concurrency)
+    return runs
+
+async def run_batch_questions(user_questions: list[str], concurrency: int, max_retries: int = 5,
+                              initial_backoff: float = 1.0) -> dict:
+    """Answers independent questions against the system prompt with abatch, timing each llm call.
+
+    Failed questions are retried in further abatch rounds with exponential backoff (or the provider's
+    Retry-After delay). Rate-limit errors also halve the concurrency for the following rounds. Answers
+    keep the order of the input questions, and the report uses the same format as the strategy runs.
+    """
+    print(f"\n📦 Answering {len(user_questions)} independent questions in batch (concurrency {concurrency})")
+    inputs = [add_publication_context(system_msg + [HumanMessage(content=question)], question)
+              for question in user_questions]
+    responses: list = [None] * len(user_questions)
+    latencies = [0.0] * len(user_questions)
+    invoke_kwargs = prefix_cache_kwargs(llm, system_prompts)
+
+    async def timed_ainvoke(messages: list) -> tuple:
+        # Each question is timed on its own, not by the wall time of its abatch round
+        started = time.perf_counter()
+        response = await llm.ainvoke(messages, **invoke_kwargs)
+        return response, time.perf_counter() - started
+
+    timed_llm = RunnableLambda(timed_ainvoke)
+    pending = list(range(len(user_questions)))
+    backoff = initial_backoff
+    for attempt in range(max_retries + 1):
+        with request_priority(Priority.BATCH):
+            results = await timed_llm.abatch([inputs[i] for i in pending], config={"max_concurrency": concurrency},
+                                             return_exceptions=True)
+        failed = []
+        for idx, result in zip(pending, results):
+            if isinstance(result, Exception):
+                responses[idx] = result
+                failed.append(idx)
+            else:
+                responses[idx], latencies[idx] = result
+        if not failed or attempt == max_retries:
+            break
 
-def run_single_strategy():
-    """Prompts the user to select a memory strategy and sets the strategy variable."""
+        errors = [responses[idx] for idx in failed]
+        if rate_limited := [error for error in errors if is_rate_limit_error(error)]:
+            concurrency = max(1, concurrency // 2)
+        delay = max([retry_after_seconds(error) or 0.0 for error in rate_limited] + [backoff])
+        print(f"  ⚠️ {len(failed)} questions failed ({len(rate_limited)} rate limited), "
+              f"retrying in {delay:.1f}s with concurrency {concurrency}")
+        await asyncio.sleep(delay)
+        backoff *= 2
+        pending = failed
+
+    qa_pairs = []
+    token_progression = []
+    for idx, (question, response) in enumerate(zip(user_questions, responses), start=1):
+        if isinstance(response, Exception):
+            print(f"  ❌ Error at question {idx}: {response}")
+            answer = f"ERROR: {response}"
+            cache_stats = {'cached_prompt_tokens': None, 'uncached_prompt_tokens': None}
+        else:
+            answer = response.content
+            cache_stats = prompt_cache_stats(response)
+        prompt_tokens = count_message_tokens(inputs[idx - 1])
+        response_tokens = count_tokens(answer)
+        qa_pairs.append({"question": question, "response": answer})
+        token_progression.append({
+            'question_num': idx,
+            'prompt_tokens': prompt_tokens,
+            'response_tokens': response_tokens,
+            'total_tokens': prompt_tokens + response_tokens,
+            'latency_s': latencies[idx - 1],
+            **cache_stats
+        })
+
+    final_prompt = messages_to_string(inputs[-1], include_publication=False) if inputs else ""
+    final_response = qa_pairs[-1]["response"] if qa_pairs else ""
+    save_strategy_results("batch", qa_pairs, final_prompt, final_response, token_progression, user_questions)
+    if rate_limit_table := get_scheduler().format_metrics():
+        print(rate_limit_table)
+    return {"strategy": "batch", "qa_pairs": qa_pairs, "token_progression": token_progression}
+
+def run_single_strategy(resume: bool = False):
+    """Prompts the user to select a memory strategy and sets the strategy variable.
+
+    Args:
+        resume (bool): Continue the logged conversation of the selected strategy instead of starting over.
+    """
     choice = input("Select a memory strategy by number (default = 1): ").strip()
     strategy = strategy_map.get(str(choice), "trimming")
     print(f"Selected strategy:{strategy.upper()}")
@@ -253,56 +656,114 @@ def run_single_strategy():
     # run strategy
     stats = run_conversation_using_memory_strategy(
         strategy=strategy,
-        user_questions=selected_questions
+        user_questions=selected_questions,
+        resume=resume
     )
+    if isinstance(llm, ModelRouter):
+        print(llm.format_stats())
+    if rate_limit_table := get_scheduler().format_metrics():
+        print(rate_limit_table)
+    if latency_table := get_tracer().format_summary():
+        print(latency_table)
 
 def load_questions() -> list[str]:
     """Loads user questions from a YAML configuration file."""
-    questions_cfg = load_yaml(os.path.join(DATA_DIR, "yzN0OCQT7hUS_questions.yaml"))
+    questions_cfg = load_yaml(os.path.join(DATA_DIR, f"{PUBLICATION_EXTERNAL_ID}_questions.yaml"))
     user_questions = questions_cfg.get("questions", [])
     print("✓ User questions loaded.")
     return user_questions
 
 
-def bootstrap() -> tuple[dict, ChatGroq, str, list[str], list[str]]:
+def bootstrap(use_fake_llm: bool = False) -> tuple[dict, BaseChatModel, str, list[str], list[str]]:
     """Bootstraps the LLM and system prompts for the AI assistant application.
+    Args:
+        use_fake_llm (bool): Use an offline fake chat model instead of the configured LLM, e.g. for benchmarks in CI.
     Returns:
-        tuple: A tuple containing the initialized ChatGroq LLM instance and the system prompt string.
+        tuple: A tuple containing the initialized LLM instance and the system prompt string.
     """
     load_dotenv()
     app_cfg = load_yaml(APP_CONFIG_FPATH)
     print("✓ Application configuration loaded.")
-    llm_client = ChatGroq(
-        model=app_cfg.get("llm", "llama-3.1-8b-instant"),
-        temperature=0.7,
-        api_key=os.getenv("GROQ_API_KEY"),
-    )
+    if use_fake_llm:
+        llm_client = FakeChatModel(
+            latency=app_cfg.get("fake_llm_latency", 0.05),
+            token_latency=app_cfg.get("fake_llm_token_latency", 0.0)
+        )
+        if (scheduler := get_scheduler()).limits("fake"):
+            llm_client = ScheduledChatModel(model=llm_client, provider="fake", scheduler=scheduler)
+        if tracing_enabled():
+            llm_client.callbacks = [get_tracing_handler()]
+    elif app_cfg.get("router", {}).get("enabled", False):
+        llm_client = get_router(temperature=0.7)
+    else:
+        llm_client = get_model(app_cfg.get("llm", "llama-3.1-8b-instant"), temperature=0.7)
     print("✓ LLM client initialized.")
+    # With publication retrieval, relevant publication chunks are added per question instead
+    use_publication_retrieval = app_cfg.get("publication_retrieval", {}).get("enabled", False)
     sys_prompts = load_system_prompts(
         key="ai_assistant_system_prompt_advanced",
-        publication_external_id="yzN0OCQT7hUS"
+        publication_external_id=None if use_publication_retrieval else PUBLICATION_EXTERNAL_ID
     )
     print("✓ System prompts loaded.")
-    memory_strategies = ["stuffing", "trimming", "summarization"]
+    memory_strategies = ["stuffing", "trimming", "summarization", "retrieval"]
+    if not retrieval_available():
+        print(f"⚠️ Retrieval strategy skipped: it needs {', '.join(RETRIEVAL_PACKAGES)}.")
+        memory_strategies.remove("retrieval")
     print("✓ Memory strategies defined.")
     return app_cfg, llm_client, sys_prompts, memory_strategies, load_questions()
 
 
-if __name__ == "__main__":
-    print("Bootstrapping App Config, LLM and system prompts...")
-    app_config, llm, system_prompts, strategies, questions = bootstrap()
-    memory_cfg = app_config.get("memory_strategies", {})
-    system_msg = [SystemMessage(content=system_prompts)]
-    print("Added system prompts to system message.")
-    strategy_map: dict[str, str] = {}
-    print("✓ Bootstrap complete.\n")
-    print("Available memory strategies:")
-    for i, stgy in enumerate(strategies, start=1):
-        strategy_map[str(i)] = stgy
-        print(f"{str(i)}: {stgy}")
-    run_single_strategy()
+def configure(app_cfg: dict, llm_client: BaseChatModel, sys_prompts: str) -> None:
+    """Sets the module-level configuration, LLM and system message that the strategies use.
 
+    Called by the command line entry point and by other modules (e.g. the session server) that run
+    the strategies. The system prompt is interned so every session shares one copy.
+    """
+    global app_config, llm, system_prompts, memory_cfg, system_msg
+    app_config, llm, system_prompts = app_cfg, llm_client, sys.intern(sys_prompts)
+    memory_cfg = app_cfg.get("memory_strategies", {})
+    system_msg = [SystemMessage(content=system_prompts)]
 
 
+def parse_args() -> argparse.Namespace:
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(description="Compare memory strategies for the publication assistant.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Run all strategies concurrently without prompting and save a comparison table.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Answer the questions independently (no conversation history) with llm.abatch.")
+    parser.add_argument("--fake-llm", action="store_true", help="Use an offline fake chat model.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Max in-flight LLM calls in benchmark/batch mode.")
+    parser.add_argument("--num-questions", type=int, default=None,
+                        help="Number of questions in benchmark/batch mode.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the interrupted conversation of the selected strategy from its log.")
+    return parser.parse_args()
 
 
+if __name__ == "__main__":
+    args = parse_args()
+    print("Bootstrapping App Config, LLM and system prompts...")
+    app_config, llm, system_prompts, strategies, questions = bootstrap(use_fake_llm=args.fake_llm)
+    configure(app_config, llm, system_prompts)
+    print("Added system prompts to system message.")
+    strategy_map: dict[str, str] = {}
+    print("✓ Bootstrap complete.\n")
+    selected = questions[:args.num_questions] if args.num_questions else questions
+    if args.benchmark:
+        asyncio.run(run_benchmark(
+            user_questions=selected,
+            concurrency=args.concurrency or memory_cfg.get("benchmark_concurrency", 4)
+        ))
+    elif args.batch:
+        asyncio.run(run_batch_questions(
+            user_questions=selected,
+            concurrency=args.concurrency or memory_cfg.get("batch_concurrency", 8),
+            max_retries=memory_cfg.get("batch_max_retries", 5)
+        ))
+    else:
+        print("Available memory strategies:")
+        for i, stgy in enumerate(strategies, start=1):
+            strategy_map[str(i)] = stgy
+            print(f"{str(i)}: {stgy}")
+        run_single_strategy(resume=args.resume)
@@ -1,17 +1,12 @@
-import os
-
 from dotenv import load_dotenv
 from langchain_classic.chains.conversation.base import ConversationChain
 from langchain_classic.memory import ConversationBufferMemory, ConversationBufferWindowMemory, ConversationSummaryMemory
-from langchain_groq import ChatGroq
+
+from llms import get_model
 
 load_dotenv()
 
-llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0.7,
-    api_key=os.getenv("GROQ_API_KEY"),
-)
+llm = get_model("llama-3.1-8b-instant", temperature=0.7)
 
 # 1. Stuff Everything In Memory Strategy
 buffer_memory = ConversationBufferMemory(
@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, PrivateAttr
+
+from fake_llms import FakeChatModel
+from file_utils import load_yaml
+from llms import get_model, is_rate_limit_error, retry_after_seconds
+from paths import APP_CONFIG_FPATH
+
+
+class ModelHealth:
+    """Rolling latency and error statistics of one routed model."""
+
+    def __init__(self, window: int):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.failures: deque[bool] = deque(maxlen=window)
+        self.cooldown_until = 0.0
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.failures.append(False)
+
+    def record_failure(self, cooldown_s: float = 0.0) -> None:
+        self.failures.append(True)
+        if cooldown_s:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown_s)
+
+    @property
+    def p50(self) -> float | None:
+        return statistics.median(self.latencies) if self.latencies else None
+
+    @property
+    def p95(self) -> float | None:
+        if len(self.latencies) < 2:
+            return self.p50
+        return statistics.quantiles(self.latencies, n=20)[-1]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.failures) / len(self.failures) if self.failures else 0.0
+
+    def is_healthy(self, max_error_rate: float, min_samples: int) -> bool:
+        """A model is unhealthy while rate-limited or when its recent error rate is too high."""
+        if time.monotonic() < self.cooldown_until:
+            return False
+        return len(self.failures) < min_samples or self.error_rate <= max_error_rate
+
+
+class ModelRouter(BaseChatModel):
+    """Chat model that sends each request to the fastest healthy model of a group of equivalent models.
+
+    Healthy models are ranked by rolling p50 latency (untried models first, then config order). A
+    failed request falls back to the next model; a rate-limited model is skipped for its Retry-After
+    delay (or `rate_limit_cooldown_s`). With `hedge_after_s`, a request still unanswered after that
+    many seconds is also sent to the next model and the first answer wins.
+
+    The router is a regular BaseChatModel, so it works with invoke/ainvoke/stream/abatch and chains.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    models: dict[str, BaseChatModel]
+    hedge_after_s: float | None = None
+    max_error_rate: float = 0.5
+    min_samples: int = 5
+    window: int = 100
+    rate_limit_cooldown_s: float = 30.0
+
+    _health: dict[str, ModelHealth] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _executor: ThreadPoolExecutor | None = PrivateAttr(default=None)
+
+    def model_post_init(self, context: Any) -> None:
+        self._health = {name: ModelHealth(self.window) for name in self.models}
+
+    @property
+    def _llm_type(self) -> str:
+        return "model-router"
+
+    @property
+    def model_name(self) -> str:
+        """Name of the preferred model, used e.g. for local token counting."""
+        return next(iter(self.models))
+
+    def ranked_models(self) -> list[str]:
+        """Model names in the order they should be tried: healthy models by p50 latency, then the rest."""
+        order = {name: i for i, name in enumerate(self.models)}
+        with self._lock:
+            healthy = [name for name, health in self._health.items()
+                       if health.is_healthy(self.max_error_rate, self.min_samples)]
+            unhealthy = sorted((name for name in self.models if name not in healthy),
+                               key=lambda name: (self._health[name].cooldown_until, self._health[name].error_rate))
+            healthy.sort(key=lambda name: (self._health[name].p50 or 0.0, order[name]))
+        return healthy + unhealthy
+
+    def _record(self, name: str, latency: float | None, error: BaseException | None = None) -> None:
+        with self._lock:
+            health = self._health[name]
+            if error is None:
+                health.record_success(latency)
+            elif is_rate_limit_error(error):
+                health.record_failure(retry_after_seconds(error) or self.rate_limit_cooldown_s)
+            else:
+                health.record_failure()
+
+    def _call(self, name: str, messages: list[BaseMessage], stop: list[str] | None, **kwargs: Any) -> ChatResult:
+        started = time.perf_counter()
+        try:
+            message = self.models[name].invoke(messages, stop=stop, **kwargs)
+        except Exception as e:
+            self._record(name, None, e)
+            raise
+        self._record(name, time.perf_counter() - started)
+        return self._build_result(name, message)
+
+    async def _acall(self, name: str, messages: list[BaseMessage], stop: list[str] | None,
+                     **kwargs: Any) -> ChatResult:
+        started = time.perf_counter()
+        try:
+            message = await self.models[name].ainvoke(messages, stop=stop, **kwargs)
+        except asyncio.CancelledError:
+            # The hedged twin answered first; not a failure of this model
+            raise
+        except Exception as e:
+            self._record(name, None, e)
+            raise
+        self._record(name, time.perf_counter() - started)
+        return self._build_result(name, message)
+
+    @staticmethod
+    def _build_result(name: str, message: BaseMessage) -> ChatResult:
+        message.response_metadata = {**message.response_metadata, "routed_model": name}
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"model_name": name})
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        candidates = iter(self.ranked_models())
+        if not self.hedge_after_s:
+            last_error = None
+            for name in candidates:
+                try:
+                    return self._call(name, messages, stop, **kwargs)
+                except Exception as e:
+                    last_error = e
+            raise last_error
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="model-router")
+        pending: dict[Future, str] = {}
+
+        def launch() -> bool:
+            name = next(candidates, None)
+            if name is not None:
+                pending[self._executor.submit(self._call, name, messages, stop, **kwargs)] = name
+            return name is not None
+
+        launch()
+        last_error = None
+        while pending:
+            done, _ = wait(pending, timeout=self.hedge_after_s, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for future in done:
+                pending.pop(future)
+                if future.exception() is None:
+                    # Slower hedged calls finish in the background and still update the statistics
+                    return future.result()
+                last_error = future.exception()
+            if not pending:
+                launch()
+        raise last_error
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        candidates = iter(self.ranked_models())
+        pending: set[asyncio.Task] = set()
+
+        def launch() -> bool:
+            name = next(candidates, None)
+            if name is not None:
+                pending.add(asyncio.create_task(self._acall(name, messages, stop, **kwargs)))
+            return name is not None
+
+        launch()
+        last_error = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_after_s or None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # Streams are not hedged; a model that fails before its first chunk falls back to the next one
+        last_error = None
+        for name in self.ranked_models():
+            started = time.perf_counter()
+            streamed = False
+            try:
+                for chunk in self.models[name].stream(messages, stop=stop, **kwargs):
+                    streamed = True
+                    generation = ChatGenerationChunk(message=chunk)
+                    if run_manager:
+                        run_manager.on_llm_new_token(generation.text, chunk=generation)
+                    yield generation
+            except Exception as e:
+                self._record(name, None, e)
+                if streamed:
+                    raise
+                last_error = e
+                continue
+            self._record(name, time.perf_counter() - started)
+            return
+        raise last_error
+
+    async def _astream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        last_error = None
+        for name in self.ranked_models():
+            started = time.perf_counter()
+            streamed = False
+            try:
+                async for chunk in self.models[name].astream(messages, stop=stop, **kwargs):
+                    streamed = True
+                    generation = ChatGenerationChunk(message=chunk)
+                    if run_manager:
+                        await run_manager.on_llm_new_token(generation.text, chunk=generation)
+                    yield generation
+            except Exception as e:
+                self._record(name, None, e)
+                if streamed:
+                    raise
+                last_error = e
+                continue
+            self._record(name, time.perf_counter() - started)
+            return
+        raise last_error
+
+    def stats(self) -> dict[str, dict]:
+        """Rolling statistics per model."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "calls": len(health.failures),
+                    "p50_s": health.p50,
+                    "p95_s": health.p95,
+                    "error_rate": health.error_rate,
+                    "cooldown_s": max(health.cooldown_until - now, 0.0),
+                }
+                for name, health in self._health.items()
+            }
+
+    def format_stats(self) -> str:
+        """Markdown table of the rolling statistics."""
+        def seconds(value: float | None) -> str:
+            return "n/a" if value is None else f"{value:.3f}"
+
+        content = ["| Model | Calls | P50 (s) | P95 (s) | Error Rate | Cooldown (s) |",
+                   "|-------|-------|---------|---------|------------|--------------|"]
+        for name, row in self.stats().items():
+            content.append(f"| {name} | {row['calls']} | {seconds(row['p50_s'])} | {seconds(row['p95_s'])} "
+                           f"| {row['error_rate']:.0%} | {row['cooldown_s']:.1f} |")
+        return "\n".join(content)
+
+
+def get_router(temperature: float = 0.0, model_names: list[str] | None = None) -> ModelRouter:
+    """Builds a router over the equivalent models listed in the `router` section of the app config.
+
+    Args:
+        temperature: Sampling temperature of every routed model.
+        model_names: Models to route between, overriding the configured list.
+    """
+    router_cfg = load_yaml(APP_CONFIG_FPATH).get("router", {})
+    model_names = model_names or router_cfg.get("models", ["llama-3.1-8b-instant"])
+    return ModelRouter(
+        models={name: get_model(name, temperature=temperature) for name in model_names},
+        hedge_after_s=router_cfg.get("hedge_after_s"),
+        max_error_rate=router_cfg.get("max_error_rate", 0.5),
+        min_samples=router_cfg.get("min_samples", 5),
+        window=router_cfg.get("window", 100),
+        rate_limit_cooldown_s=router_cfg.get("rate_limit_cooldown_s", 30.0),
+    )
+
+
+def create_fake_router(hedge_after_s: float | None = 0.5) -> ModelRouter:
+    """Router over offline fake models with different latency and failure profiles, for local testing."""
+    return ModelRouter(
+        models={
+            "fast-flaky": FakeChatModel(model_name="fast-flaky", latency=0.05, latency_jitter=0.05, error_rate=0.3),
+            "fast-rate-limited": FakeChatModel(model_name="fast-rate-limited", latency=0.03, rate_limit_rate=0.2),
+            "slow-steady": FakeChatModel(model_name="slow-steady", latency=0.3, latency_jitter=1.0),
+        },
+        hedge_after_s=hedge_after_s,
+        min_samples=3,
+        window=20,
+        rate_limit_cooldown_s=1.0,
+    )
+
+
+async def run_fake_load(router: ModelRouter, requests: int, concurrency: int) -> tuple[int, int, float]:
+    """Sends concurrent requests through the router; returns (succeeded, failed, wall time in seconds)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> bool:
+        async with semaphore:
+            try:
+                await router.ainvoke([HumanMessage(content=f"Question {i}")])
+                return True
+            except Exception:
+                return False
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    return sum(results), len(results) - sum(results), time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exercise the model router against fake models that inject "
+                                                 "latency, errors and rate limits.")
+    parser.add_argument("--requests", type=int, default=200, help="Number of requests.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests.")
+    parser.add_argument("--hedge-after", type=float, default=0.5, help="Hedge delay in seconds (0 disables).")
+    args = parser.parse_args()
+
+    fake_router = create_fake_router(hedge_after_s=args.hedge_after or None)
+    succeeded, failed, wall_time = asyncio.run(run_fake_load(fake_router, args.requests, args.concurrency))
+    print(f"{succeeded} succeeded, {failed} failed in {wall_time:.2f}s")
+    print(fake_router.format_stats())
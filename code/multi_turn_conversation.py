@@ -1,15 +1,11 @@
-import os
-
 from dotenv import load_dotenv
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain_groq import ChatGroq
+
+from llms import get_model, prompt_cache_usage
+from streaming import stream_chat
 
 load_dotenv()
-llm = ChatGroq(
-    model_name="llama-3.1-8b-instant",
-    temperature=0.0,
-    api_key=os.getenv("GROQ_API_KEY")
-)
+llm = get_model("llama-3.1-8b-instant", temperature=0.0)
 
 publication_content = """
 Title: One Model, Five Superpowers: The Versatility of Variational Autoencoders
@@ -32,6 +28,7 @@ of VAEs, we can effectively identify anomalous patterns in data, enhancing the r
 applications.
 """
 
+# The system message stays first and unchanged, so providers can serve it from their prompt cache on later turns
 conversation = [
     SystemMessage(
         content=f"""
@@ -47,9 +44,10 @@ conversation.append(
     )
 )
 
-response1 = llm.invoke(conversation)
 print("🤖 AI Response to Question 1:")
-print(response1.content)
+response1, stats1 = stream_chat(llm, conversation)
+print(f"\n⏱️ {stats1}")
+print("🪙 Prompt tokens (total, cached):", prompt_cache_usage(response1))
 print("\n" + "="*50 + "\n")
 conversation.append(
     AIMessage(
@@ -63,6 +61,7 @@ conversation.append(
        """
    )
 )
-response2 = llm.invoke(conversation)
 print("🤖 AI Response to Question 2:")
-print(response2.content)
\ No newline at end of file
+response2, stats2 = stream_chat(llm, conversation)
+print(f"\n⏱️ {stats2}")
+print("🪙 Prompt tokens (total, cached):", prompt_cache_usage(response2))
@@ -0,0 +1,189 @@
+import uuid
+from collections.abc import Hashable, Iterable
+from typing import Any, Callable
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scales each row to unit length so that dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyVectorStore(VectorStore):
+    """In-memory LangChain vector store backed by one contiguous, normalized float32 matrix.
+
+    Search is a matrix multiply followed by `argpartition`, so several queries are scored at once.
+    For each (metadata key, value) pair a boolean row mask is kept up to date on insert, and
+    filters are applied with these masks before scoring. Scores are cosine similarities (higher is
+    more similar).
+    """
+
+    # Element type of the row matrix; subclasses may store encoded rows instead of float32 vectors
+    _row_dtype = np.float32
+
+    def __init__(self, embedding: Embeddings, initial_capacity: int = 1024):
+        self.embedding = embedding
+        self._capacity = initial_capacity
+        self._size = 0
+        self._vectors: np.ndarray | None = None
+        self._documents: list[Document] = []
+        self._ids: list[str] = []
+        self._masks: dict[tuple[str, Hashable], np.ndarray] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Grows the matrix and masks (doubling capacity) so that `rows` more vectors fit."""
+        if self._vectors is None:
+            self._capacity = max(self._capacity, rows)
+            self._vectors = np.zeros((self._capacity, dim), dtype=self._row_dtype)
+        needed = self._size + rows
+        if needed <= self._capacity:
+            return
+        while self._capacity < needed:
+            self._capacity *= 2
+        vectors = np.zeros((self._capacity, dim), dtype=self._row_dtype)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        for key, mask in self._masks.items():
+            grown = np.zeros(self._capacity, dtype=bool)
+            grown[:self._size] = mask[:self._size]
+            self._masks[key] = grown
+
+    def add_vectors(self, vectors: np.ndarray, documents: list[Document], ids: list[str] | None = None) -> list[str]:
+        """Adds precomputed embeddings with their documents.
+
+        Returns:
+            The ids of the added documents.
+        """
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in documents]
+        self._reserve(len(documents), vectors.shape[1])
+        start = self._size
+        self._vectors[start:start + len(documents)] = vectors
+        self._index_documents(documents, ids)
+        return ids
+
+    def _index_documents(self, documents: list[Document], ids: list[str]) -> None:
+        """Records documents whose rows were just written after the current size, and updates the metadata masks."""
+        start = self._size
+        for offset, document in enumerate(documents):
+            for key, value in document.metadata.items():
+                if not isinstance(value, Hashable):
+                    continue
+                if (key, value) not in self._masks:
+                    self._masks[(key, value)] = np.zeros(self._capacity, dtype=bool)
+                self._masks[(key, value)][start + offset] = True
+        self._documents.extend(documents)
+        self._ids.extend(ids)
+        self._size += len(documents)
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, *,
+                  ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        return self.add_vectors(vectors, documents, ids)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        if not ids or self._size == 0:
+            return None
+        to_delete = set(ids)
+        keep = np.array([doc_id not in to_delete for doc_id in self._ids], dtype=bool)
+        kept_rows = np.flatnonzero(keep)
+        self._vectors[:len(kept_rows)] = self._vectors[kept_rows]
+        for key, mask in self._masks.items():
+            mask[:len(kept_rows)] = mask[kept_rows]
+            mask[len(kept_rows):] = False
+        self._documents = [self._documents[row] for row in kept_rows]
+        self._ids = [self._ids[row] for row in kept_rows]
+        self._size = len(kept_rows)
+        return True
+
+    def filter_mask(self, filter: dict | None) -> np.ndarray | None:
+        """Builds the row mask for a metadata filter.
+
+        A filter maps metadata keys to a value or a list of accepted values, e.g.
+        `{"topic": ["tourism", "culture"], "type": "fact"}`. Keys are combined with AND.
+        """
+        if not filter:
+            return None
+        mask = np.ones(self._size, dtype=bool)
+        empty = np.zeros(self._capacity, dtype=bool)
+        for key, accepted in filter.items():
+            values = accepted if isinstance(accepted, (list, tuple, set)) else [accepted]
+            key_mask = np.zeros(self._size, dtype=bool)
+            for value in values:
+                key_mask |= self._masks.get((key, value), empty)[:self._size]
+            mask &= key_mask
+        return mask
+
+    def search_by_vectors(self, query_vectors: np.ndarray, k: int = 4,
+                          filter: dict | None = None) -> list[list[tuple[Document, float]]]:
+        """Returns the top-k documents and cosine similarities for each query vector.
+
+        Args:
+            query_vectors: Query embeddings, one per row.
+            k: Number of results per query.
+            filter: Optional metadata filter, see `filter_mask`.
+        """
+        query_vectors = normalize_rows(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if self._size == 0:
+            return [[] for _ in query_vectors]
+        rows = np.arange(self._size)
+        if (mask := self.filter_mask(filter)) is not None:
+            rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return [[] for _ in query_vectors]
+
+        candidates = self._vectors[rows] if len(rows) < self._size else self._vectors[:self._size]
+        scores = query_vectors @ candidates.T
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(self._documents[rows[col]], float(score)) for col, score in zip(query_top, query_scores)]
+            for query_top, query_scores in zip(top, top_scores)
+        ]
+
+    def batch_similarity_search_with_score(self, queries: list[str], k: int = 4,
+                                           filter: dict | None = None) -> list[list[tuple[Document, float]]]:
+        """Runs several text queries at once with a single matrix multiply."""
+        return self.search_by_vectors(np.asarray(self.embedding.embed_documents(queries)), k=k, filter=filter)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict | None = None,
+                                     **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.search_by_vectors(np.asarray([self.embedding.embed_query(query)]), k=k, filter=filter)[0]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, filter: dict | None = None,
+                                    **kwargs: Any) -> list[Document]:
+        return [document for document, _ in self.search_by_vectors(np.asarray([embedding]), k=k, filter=filter)[0]]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity in [-1, 1] mapped to a relevance score in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: list[dict] | None = None, *,
+                   ids: list[str] | None = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+# Embedding model of the current worker process, loaded once by init_worker
+_worker_model = None
+
+
+def init_worker(model_name: str, threads_per_worker: int) -> None:
+    """Loads the sentence-transformer model once per worker process."""
+    global _worker_model
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    # One intra-op thread per process, otherwise every worker competes for all cores
+    torch.set_num_threads(threads_per_worker)
+    _worker_model = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
+
+
+def embed_batch(texts: list[str]) -> list[list[float]]:
+    """Embeds one batch of texts with the worker's model."""
+    return _worker_model.embed_documents(texts)
+
+
+def plan_batches(texts: list[str], max_batch_chars: int, max_batch_size: int) -> list[list[int]]:
+    """Groups text indices into batches of similar length under a character budget.
+
+    Texts are sorted by length so each batch pads to a similar sequence length; long texts end up in
+    small batches and short texts in large ones.
+
+    Args:
+        texts: Texts to embed.
+        max_batch_chars: Maximum total characters per batch.
+        max_batch_size: Maximum number of texts per batch.
+
+    Returns:
+        Lists of indices into `texts`, one list per batch.
+    """
+    batches = []
+    current: list[int] = []
+    current_chars = 0
+    for idx in sorted(range(len(texts)), key=lambda i: len(texts[i])):
+        length = len(texts[idx])
+        if current and (current_chars + length > max_batch_chars or len(current) == max_batch_size):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(idx)
+        current_chars += length
+    if current:
+        batches.append(current)
+    return batches
+
+
+class ParallelEmbeddings(Embeddings):
+    """LangChain embeddings that shard batches across a pool of worker processes.
+
+    Each worker loads the model once; batches are sized by text length and results are reassembled
+    in input order, so this can be passed anywhere a HuggingFaceEmbeddings instance is accepted,
+    e.g. Chroma.from_documents.
+    """
+
+    def __init__(self, model_name: str, workers: int | None = None, threads_per_worker: int = 1,
+                 max_batch_chars: int = 16_000, max_batch_size: int = 64):
+        self.model_name = model_name
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker
+        self.max_batch_chars = max_batch_chars
+        self.max_batch_size = max_batch_size
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Starts the worker pool on first use."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.model_name, self.threads_per_worker),
+            )
+        return self._pool
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        batches = plan_batches(texts, self.max_batch_chars, self.max_batch_size)
+        pool = self._get_pool()
+        futures = [pool.submit(embed_batch, [texts[i] for i in batch]) for batch in batches]
+
+        vectors: list[list[float] | None] = [None] * len(texts)
+        for batch, future in zip(batches, futures):
+            for idx, vector in zip(batch, future.result()):
+                vectors[idx] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def close(self) -> None:
+        """Shuts down the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> "ParallelEmbeddings":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
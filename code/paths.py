@@ -11,7 +11,17 @@ PROMPT_CONFIG_FPATH = os.path.join(CODE_DIR, "config", "prompt_config.yaml")
 
 
 OUTPUTS_DIR = os.path.join(ROOT_DIR, "outputs")
+METRICS_DIR = os.path.join(OUTPUTS_DIR, "metrics")
 
 
 DATA_DIR = os.path.join(ROOT_DIR, "data")
 # PUBLICATION_FPATH = os.path.join(DATA_DIR, "publication.md")
+
+
+CACHE_DIR = os.path.join(ROOT_DIR, "cache")
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+CHROMA_DIR = os.path.join(CACHE_DIR, "chroma")
+INGESTION_MANIFEST_FPATH = os.path.join(CACHE_DIR, "ingestion_manifest.json")
+RESPONSE_CACHE_FPATH = os.path.join(CACHE_DIR, "llm_responses.sqlite")
+SESSIONS_DIR = os.path.join(CACHE_DIR, "sessions")
+CONVERSATION_LOG_DIR = os.path.join(CACHE_DIR, "conversation_logs")
@@ -1,8 +1,15 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
 from str_utils import add_prefix
 from constants import PUBLICATION_CONTENT_FOOTER
 from file_utils import load_yaml, load_publication
 
-from paths import PROMPT_CONFIG_FPATH
+from paths import DATA_DIR, PROMPT_CONFIG_FPATH
+from publication_index import get_publication_index
+from token_counter import DEFAULT_TOKEN_MODEL
 from constants import PUBLICATION_CONTENT_HEADER
 
 
@@ -34,17 +41,135 @@ def format_prompt_section(lead_in: str, value: str | list[str]) -> str:
     return f"{lead_in}\n{formatted_value}"
 
 
-def build_system_prompt_from_config(publication_external_id = "yzN0OCQT7hUS") -> str:
-    """ Build system prompt from configuration.
-    System prompt includes scope (publication), role/personality, constraints, style, format, and goal.
+PUBLICATION_LEAD_IN = "Base your responses on this publication content:\n\n"
+
+# Parsed prompt config and built prompts, invalidated by the mtimes that are part of their keys. The
+# compiled and built prompts are kept in LRU order and bounded, so long-running processes do not grow them
+MAX_CACHED_PROMPTS = 64
+_prompt_config_cache: dict[float, dict] = {}
+_compiled_prompt_cache: OrderedDict[tuple, "CompiledPrompt"] = OrderedDict()
+_built_prompt_cache: OrderedDict[tuple, str] = OrderedDict()
+_cache_lock = threading.Lock()
+_compile_lock = threading.Lock()
+
+
+def format_publication_section(publication_content: str) -> str:
+    """Wraps publication content in the lead-in and the publication markers."""
+    return (
+        PUBLICATION_LEAD_IN +
+        f"{PUBLICATION_CONTENT_HEADER}\n"
+        f"{publication_content.strip()}\n"
+        f"{PUBLICATION_CONTENT_FOOTER}"
+    )
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """A system prompt with every configured section already formatted.
+
+    Rendering only appends the publication block (if any) and joins the parts.
     """
-    print("Loading publication content...")
-    publication_content = load_publication(publication_external_id)
-    prompt_configs = load_yaml(PROMPT_CONFIG_FPATH)
-    system_prompt_config_name = "ai_assistant_system_prompt_advanced"
-    system_prompt_config = prompt_configs.get(system_prompt_config_name)
+    sections: tuple[str, ...]
+    separator: str
+
+    def render(self, publication_content: str | None = None) -> str:
+        """Renders the prompt, optionally followed by the publication content."""
+        parts = list(self.sections)
+        if publication_content:
+            parts.append(format_publication_section(publication_content))
+        return self.separator.join(parts)
+
+
+def file_mtime(file_path: str) -> float | None:
+    """Returns the modification time of a file, or None if it does not exist."""
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return None
+
+
+def publication_mtime(publication_external_id: str | None) -> float | None:
+    """Returns the modification time of a publication file in the data directory, if there is one."""
+    if publication_external_id is None:
+        return None
+    return file_mtime(os.path.join(DATA_DIR, f"{publication_external_id}.md"))
+
+
+def load_prompt_configs() -> dict:
+    """Loads the prompt configuration YAML, parsing it again only when the file has changed."""
+    mtime = file_mtime(PROMPT_CONFIG_FPATH)
+    with _cache_lock:
+        if mtime not in _prompt_config_cache:
+            _prompt_config_cache.clear()
+            _prompt_config_cache[mtime] = load_yaml(PROMPT_CONFIG_FPATH)
+        return _prompt_config_cache[mtime]
+
+
+def _cache_get(cache: OrderedDict, cache_key: tuple):
+    """Returns a cached value (None if missing) and marks it as recently used. Call with _cache_lock held."""
+    if cache_key in cache:
+        cache.move_to_end(cache_key)
+        return cache[cache_key]
+    return None
+
+
+def _cache_put(cache: OrderedDict, cache_key: tuple, value) -> None:
+    """Adds a value, evicting the least recently used entries over MAX_CACHED_PROMPTS. Call with _cache_lock held."""
+    cache[cache_key] = value
+    cache.move_to_end(cache_key)
+    while len(cache) > MAX_CACHED_PROMPTS:
+        cache.popitem(last=False)
+
+
+def get_compiled_prompt(key: str, compiler) -> CompiledPrompt:
+    """Returns the compiled prompt for a config key, compiling it once per prompt config version.
+
+    Args:
+        key: Prompt config key.
+        compiler: Function turning the key's config into a CompiledPrompt.
+    """
+    cache_key = (compiler.__name__, key, file_mtime(PROMPT_CONFIG_FPATH))
+    with _cache_lock:
+        if (compiled := _cache_get(_compiled_prompt_cache, cache_key)) is not None:
+            return compiled
+    # Threads missing the same prompt compile it once; the others wait and reuse it
+    with _compile_lock:
+        with _cache_lock:
+            if (compiled := _cache_get(_compiled_prompt_cache, cache_key)) is not None:
+                return compiled
+        compiled = compiler(key, load_prompt_configs().get(key))
+        with _cache_lock:
+            _cache_put(_compiled_prompt_cache, cache_key, compiled)
+        return compiled
+
+
+def build_cached_prompt(key: str, publication_external_id: str | None, compiler) -> str | None:
+    """Returns a built prompt from the cache, building it if the prompt config or publication changed."""
+    cache_key = (
+        compiler.__name__, key, publication_external_id,
+        file_mtime(PROMPT_CONFIG_FPATH), publication_mtime(publication_external_id)
+    )
+    with _cache_lock:
+        if (prompt := _cache_get(_built_prompt_cache, cache_key)) is not None:
+            return prompt
+
+    compiled = get_compiled_prompt(key, compiler)
+    publication_content = None
+    if publication_external_id is not None:
+        print("Loading publication content...")
+        publication_content = load_publication(publication_external_id)
+        if not publication_content:
+            return None
+    prompt = compiled.render(publication_content)
+    with _cache_lock:
+        _cache_put(_built_prompt_cache, cache_key, prompt)
+    return prompt
+
+
+def compile_advanced_prompt(key: str, system_prompt_config: dict | None) -> CompiledPrompt:
+    """Compiles a prompt config into sections in the format of build_system_prompt_from_config."""
     if not system_prompt_config:
-        raise ValueError(f"System prompt config '{system_prompt_config_name}' not found")
+        raise ValueError(f"System prompt config '{key}' not found")
     prompt_parts = []
 
     # Role is required for system prompts
@@ -82,36 +207,21 @@ def build_system_prompt_from_config(publication_external_id = "yzN0OCQT7hUS") ->
             format_prompt_section("Overall goal:", goal)
         )
 
-    # Include publication content, if provided
-    if publication_content:
-        prompt_parts.append(
-            "Base your responses on this publication content:\n\n"
-            f"{PUBLICATION_CONTENT_HEADER}\n"
-            f"{publication_content.strip()}\n"
-            f"{PUBLICATION_CONTENT_FOOTER}"
-        )
-
-    return "\n\n".join(prompt_parts)
+    return CompiledPrompt(sections=tuple(prompt_parts), separator="\n\n")
 
 
-def load_system_prompts(
-        key: str,
-        publication_external_id: str
-) -> str:
-    """Loads system prompt configuration from YAML file and builds the system prompt string.
-    The system prompt includes role, style/tone, output constraints, output format, and goal.
-    Args:
-        key (str): The key to identify the specific system prompt configuration.
-    Returns:
-        str: The constructed system prompt.
-    Raises:
-        ValueError: If the specified key is not found in the prompt configuration.
-        :param key:
-        :param publication_external_id:
+def build_system_prompt_from_config(publication_external_id = "yzN0OCQT7hUS") -> str:
+    """ Build system prompt from configuration.
+    System prompt includes scope (publication), role/personality, constraints, style, format, and goal.
+    Built prompts are cached until the prompt config or the publication file changes.
     """
-    print("loading system prompts...")
-    prompt_config = load_yaml(PROMPT_CONFIG_FPATH)
-    system_prompt_config = prompt_config.get(key)
+    return build_cached_prompt(
+        "ai_assistant_system_prompt_advanced", publication_external_id, compile_advanced_prompt
+    ) or get_compiled_prompt("ai_assistant_system_prompt_advanced", compile_advanced_prompt).render()
+
+
+def compile_system_prompts(key: str, system_prompt_config: dict | None) -> CompiledPrompt:
+    """Compiles a prompt config into sections in the format of load_system_prompts."""
     if not system_prompt_config:
         raise ValueError(f"System prompt config for '{key}' not found")
     system_prompts = []
@@ -158,16 +268,58 @@ def load_system_prompts(
             )
         )
         print("✓ Added goal to system prompt.")
-    if publication_external_id is not None:
-        if publication := load_publication(publication_external_id):
-            system_prompts.append(
-               "Base your responses on this publication content:\n\n" 
-                f"{PUBLICATION_CONTENT_HEADER}\n"
-                f"{publication.strip()}\n"
-                f"{PUBLICATION_CONTENT_FOOTER}"
-            )
-            print("✓ Added publication content to system prompt.")
-        else:
-            raise ValueError(f"Publication for id {publication_external_id} not found")
+    return CompiledPrompt(sections=tuple(system_prompts), separator="\n")
+
+
+def build_publication_excerpt(publication_external_id: str, question: str, top_k: int = 4,
+                              max_publication_tokens: int = 1500, token_model: str = DEFAULT_TOKEN_MODEL) -> str:
+    """Returns only the publication chunks most relevant to a question, joined in document order.
+
+    Args:
+        publication_external_id: Publication to retrieve from. It is chunked and indexed once.
+        question: The user question the chunks should be relevant to.
+        top_k: Maximum number of chunks.
+        max_publication_tokens: Token budget for the chunks.
+        token_model: Model whose tokenizer counts the chunk tokens, e.g. `token_model_name(llm)`.
+    """
+    chunks = get_publication_index(publication_external_id).relevant_chunks(
+        question, top_k=top_k, max_tokens=max_publication_tokens, token_model=token_model
+    )
+    return "\n\n...\n\n".join(chunks)
+
+
+def load_system_prompts(
+        key: str,
+        publication_external_id: str,
+        question: str | None = None,
+        top_k: int = 4,
+        max_publication_tokens: int = 1500
+) -> str:
+    """Loads system prompt configuration from YAML file and builds the system prompt string.
+    The system prompt includes role, style/tone, output constraints, output format, and goal.
+    The YAML is parsed and each key compiled once; built prompts are cached until the prompt config
+    or the publication file changes.
+    Args:
+        key (str): The key to identify the specific system prompt configuration.
+        publication_external_id (str): The publication to base responses on, or None.
+        question (str): If given, only the top_k publication chunks relevant to this question (within
+            max_publication_tokens) are included instead of the whole publication.
+        top_k (int): Maximum number of publication chunks when a question is given.
+        max_publication_tokens (int): Token budget for publication chunks when a question is given.
+    Returns:
+        str: The constructed system prompt.
+    Raises:
+        ValueError: If the specified key is not found in the prompt configuration.
+    """
+    print("loading system prompts...")
+    if question is not None and publication_external_id is not None:
+        excerpt = build_publication_excerpt(publication_external_id, question, top_k, max_publication_tokens)
+        system_prompts = get_compiled_prompt(key, compile_system_prompts).render(excerpt)
+        print("✓ Added relevant publication chunks to system prompt.")
+        print("✓ System prompt construction complete.")
+        return system_prompts
+    system_prompts = build_cached_prompt(key, publication_external_id, compile_system_prompts)
+    if system_prompts is None:
+        raise ValueError(f"Publication for id {publication_external_id} not found")
     print("✓ System prompt construction complete.")
-    return "\n".join(system_prompts)
\ No newline at end of file
+    return system_prompts
@@ -0,0 +1,82 @@
+import hashlib
+from functools import lru_cache
+
+from langchain_core.documents import Document
+
+from chunking import CHUNK_OVERLAP, CHUNK_SIZE, create_splitter
+from embedding_cache import get_embeddings
+from file_utils import load_publication
+from paths import CHROMA_DIR
+from token_counter import DEFAULT_TOKEN_MODEL, count_tokens_many
+
+
+class PublicationIndex:
+    """Persistent vector index over the chunks of one publication.
+
+    The publication is chunked with the same splitter as chunking.process_file and embedded once;
+    the index is rebuilt only when the publication text, the splitter settings or the chunk count change.
+    """
+
+    def __init__(self, publication_external_id: str):
+        self.publication_external_id = publication_external_id
+        publication = load_publication(publication_external_id)
+        if not publication:
+            raise ValueError(f"Publication for id {publication_external_id} not found")
+        # Imported here so that modules building prompts without publication retrieval do not load Chroma
+        from langchain_community.vectorstores import Chroma
+        self.vector_store = Chroma(
+            collection_name=f"publication-{publication_external_id}",
+            embedding_function=get_embeddings(),
+            persist_directory=CHROMA_DIR,
+        )
+        self.chunks = create_splitter().split_text(publication)
+        self.fingerprint = hashlib.sha256(
+            f"{CHUNK_SIZE}:{CHUNK_OVERLAP}:{len(self.chunks)}\0{publication}".encode("utf-8")
+        ).hexdigest()
+        if not self._is_current():
+            self._rebuild()
+
+    def _is_current(self) -> bool:
+        """Returns True if the stored chunks are exactly the current chunks of the publication."""
+        stored = self.vector_store.get(include=["metadatas"])
+        return (len(stored["ids"]) == len(self.chunks)
+                and all(metadata.get("fingerprint") == self.fingerprint for metadata in stored["metadatas"]))
+
+    def _rebuild(self) -> None:
+        """Replaces the stored chunks with the chunks of the current publication text."""
+        if stale_ids := self.vector_store.get(include=[])["ids"]:
+            self.vector_store.delete(ids=stale_ids)
+        self.vector_store.add_documents(
+            [
+                Document(page_content=chunk, metadata={"chunk_id": i, "fingerprint": self.fingerprint})
+                for i, chunk in enumerate(self.chunks)
+            ],
+            ids=[f"{self.publication_external_id}:{i}" for i in range(len(self.chunks))]
+        )
+        print(f"✓ Indexed {len(self.chunks)} chunks of publication {self.publication_external_id}.")
+
+    def relevant_chunks(self, question: str, top_k: int, max_tokens: int,
+                        token_model: str = DEFAULT_TOKEN_MODEL) -> list[str]:
+        """Returns the chunks most relevant to a question that fit the token budget, in document order.
+
+        Args:
+            question: The user question.
+            top_k: Maximum number of chunks.
+            max_tokens: Token budget for the selected chunks.
+            token_model: Model whose tokenizer is used to count chunk tokens.
+        """
+        documents = self.vector_store.similarity_search(question, k=min(top_k, len(self.chunks)))
+        token_counts = count_tokens_many([document.page_content for document in documents], token_model)
+        selected = []
+        for document, tokens in zip(documents, token_counts):
+            if tokens <= max_tokens:
+                max_tokens -= tokens
+                selected.append(document)
+        selected.sort(key=lambda document: document.metadata["chunk_id"])
+        return [document.page_content for document in selected]
+
+
+@lru_cache(maxsize=None)
+def get_publication_index(publication_external_id: str) -> PublicationIndex:
+    """Returns the index of a publication, building it on first use in the process if needed."""
+    return PublicationIndex(publication_external_id)
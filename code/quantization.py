@@ -0,0 +1,252 @@
+import tempfile
+import uuid
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from ivf_index import top_k
+from numpy_vector_store import NumpyVectorStore, normalize_rows
+
+SCORE_BLOCK_ROWS = 65_536
+
+
+def kmeans(vectors: np.ndarray, n_centroids: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Euclidean k-means; returns the centroids."""
+    rng = np.random.default_rng(seed)
+    n_centroids = min(n_centroids, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=n_centroids, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(vectors, centroids)
+        sums = np.stack([np.bincount(assignments, weights=column, minlength=n_centroids) for column in vectors.T], axis=1)
+        counts = np.bincount(assignments, minlength=n_centroids)
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        counts[empty] = 1
+        centroids = (sums / counts[:, None]).astype(np.float32)
+    return centroids
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (Euclidean) for each vector."""
+    distances = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+class ScalarQuantizer:
+    """8-bit scalar quantization: each dimension is mapped linearly onto 256 levels between its trained min and max.
+
+    Codes take 1 byte per dimension (4x smaller than float32). Scores are computed asymmetrically:
+    the float query is compared with the decoded codes without quantizing the query.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.low: np.ndarray | None = None
+        self.scale: np.ndarray | None = None
+
+    @property
+    def code_size(self) -> int:
+        return self.dim
+
+    @property
+    def trained(self) -> bool:
+        return self.low is not None
+
+    @property
+    def codebook_bytes(self) -> int:
+        return 2 * self.dim * 4
+
+    def train(self, vectors: np.ndarray) -> None:
+        self.low = vectors.min(axis=0).astype(np.float32)
+        scale = (vectors.max(axis=0) - self.low) / 255.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((vectors - self.low) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.low
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Inner products of float queries with encoded vectors, decoding the codes in blocks."""
+        # q . (code * scale + low) = (q * scale) . code + q . low
+        scaled_queries = queries * self.scale
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = scaled_queries @ block.T
+        return scores + (queries @ self.low)[:, None]
+
+
+class ProductQuantizer:
+    """Product quantization: vectors are split into `n_subspaces` parts, each replaced by the id of its
+    nearest of 256 trained centroids.
+
+    Codes take 1 byte per subspace (e.g. 48 bytes instead of 1536 for a 384-dim float32 vector).
+    Scores are computed asymmetrically from a per-query table of query-to-centroid inner products.
+    """
+
+    def __init__(self, dim: int, n_subspaces: int = 48, n_centroids: int = 256):
+        if dim % n_subspaces:
+            raise ValueError(f"Dimension {dim} is not divisible by n_subspaces={n_subspaces}")
+        if n_centroids > 256:
+            raise ValueError("Product quantization codes are single bytes, use at most 256 centroids")
+        self.dim = dim
+        self.n_subspaces = n_subspaces
+        self.n_centroids = n_centroids
+        self.codebooks: np.ndarray | None = None
+
+    @property
+    def code_size(self) -> int:
+        return self.n_subspaces
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def codebook_bytes(self) -> int:
+        return 0 if self.codebooks is None else self.codebooks.nbytes
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """Reshapes (n, dim) vectors to (n, n_subspaces, sub_dim)."""
+        return vectors.reshape(len(vectors), self.n_subspaces, -1)
+
+    def train(self, vectors: np.ndarray, iterations: int = 10, sample_size: int | None = None, seed: int = 0) -> None:
+        """Fits the codebooks with k-means on a sample of the vectors (default 64 per centroid)."""
+        rng = np.random.default_rng(seed)
+        sample_size = min(sample_size or self.n_centroids * 64, len(vectors))
+        parts = self._split(vectors[np.sort(rng.choice(len(vectors), size=sample_size, replace=False))])
+        codebooks = [kmeans(np.ascontiguousarray(parts[:, j]), self.n_centroids, iterations, seed) for j in range(self.n_subspaces)]
+        # Pad codebooks of small training sets to the same number of centroids
+        n_centroids = max(len(codebook) for codebook in codebooks)
+        self.codebooks = np.stack([
+            np.concatenate([codebook, np.repeat(codebook[-1:], n_centroids - len(codebook), axis=0)])
+            for codebook in codebooks
+        ])
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = self._split(vectors)
+        return np.stack(
+            [nearest_centroids(parts[:, j], self.codebooks[j]) for j in range(self.n_subspaces)], axis=1
+        ).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.codebooks[np.arange(self.n_subspaces), codes].reshape(len(codes), self.dim)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Inner products of float queries with encoded vectors via lookup tables."""
+        # tables[q, j, c] = query q's part j . centroid c of subspace j
+        tables = np.einsum("qjd,jcd->qjc", self._split(queries), self.codebooks)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for j in range(self.n_subspaces):
+            scores += tables[:, j, codes[:, j]]
+        return scores
+
+
+class QuantizedVectorStore(NumpyVectorStore):
+    """NumpyVectorStore that keeps quantized codes in memory instead of float32 vectors.
+
+    `mode` is "int8" (scalar quantization, 4x smaller) or "pq" (product quantization, 1 byte per
+    subspace). The quantizer is trained on the first batch of added vectors, so add the bulk of the
+    corpus first, as process_file does.
+
+    With `rerank_candidates` > 0, the float vectors are also written to a disk-backed temporary file
+    and the best `rerank_candidates` rows of the quantized search are re-scored with them, which
+    recovers most of the recall lost to quantization while the resident matrix stays quantized.
+    """
+
+    _row_dtype = np.uint8
+
+    def __init__(self, embedding: Embeddings, mode: str = "int8", n_subspaces: int = 48,
+                 rerank_candidates: int = 0, initial_capacity: int = 1024):
+        if mode not in ("int8", "pq"):
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        super().__init__(embedding, initial_capacity=initial_capacity)
+        self.mode = mode
+        self.n_subspaces = n_subspaces
+        self.rerank_candidates = rerank_candidates
+        self.quantizer: ScalarQuantizer | ProductQuantizer | None = None
+        self._float_file = tempfile.TemporaryFile() if rerank_candidates else None
+        self._float_vectors: np.memmap | None = None
+
+    def add_vectors(self, vectors: np.ndarray, documents: list[Document], ids: list[str] | None = None) -> list[str]:
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        if self.quantizer is None:
+            dim = vectors.shape[1]
+            self.quantizer = ScalarQuantizer(dim) if self.mode == "int8" else ProductQuantizer(dim, self.n_subspaces)
+            self.quantizer.train(vectors)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in documents]
+        self._reserve(len(documents), self.quantizer.code_size)
+        self._vectors[self._size:self._size + len(documents)] = self.quantizer.encode(vectors)
+        if self._float_file is not None:
+            self._float_file.seek(0, 2)
+            self._float_file.write(vectors.tobytes())
+            self._float_file.flush()
+            self._float_vectors = None
+        self._index_documents(documents, ids)
+        return ids
+
+    def float_vectors(self) -> np.ndarray:
+        """Memory map of the float vectors kept for re-ranking."""
+        if self._float_vectors is None:
+            self._float_vectors = np.memmap(self._float_file, dtype=np.float32, mode="r",
+                                            shape=(self._size, self.quantizer.dim))
+        return self._float_vectors
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        if not ids or self._size == 0:
+            return None
+        if self._float_file is not None:
+            to_delete = set(ids)
+            kept = self.float_vectors()[[doc_id not in to_delete for doc_id in self._ids]]
+            self._float_vectors = None
+            self._float_file.seek(0)
+            self._float_file.truncate()
+            self._float_file.write(np.ascontiguousarray(kept).tobytes())
+            self._float_file.flush()
+        return super().delete(ids)
+
+    def search_by_vectors(self, query_vectors: np.ndarray, k: int = 4,
+                          filter: dict | None = None) -> list[list[tuple[Document, float]]]:
+        """Returns the top-k documents for each query vector, scored against the quantized codes.
+
+        Scores approximate cosine similarities; re-ranked results carry exact float scores.
+        """
+        query_vectors = normalize_rows(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if self._size == 0:
+            return [[] for _ in query_vectors]
+        rows = np.arange(self._size)
+        if (mask := self.filter_mask(filter)) is not None:
+            rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return [[] for _ in query_vectors]
+
+        codes = self._vectors[rows] if len(rows) < self._size else self._vectors[:self._size]
+        scores = self.quantizer.scores(query_vectors, codes)
+        top, top_scores = top_k(scores, max(k, self.rerank_candidates))
+        if self.rerank_candidates:
+            float_vectors = self.float_vectors()
+            exact = np.stack([float_vectors[rows[query_top]] @ query for query, query_top in zip(query_vectors, top)])
+            keep, top_scores = top_k(exact, k)
+            top = np.take_along_axis(top, keep, axis=1)
+        return [
+            [(self._documents[rows[col]], float(score)) for col, score in zip(query_top[:k], query_scores[:k])]
+            for query_top, query_scores in zip(top, top_scores)
+        ]
+
+    def memory_usage(self) -> dict:
+        """Bytes held for the stored vectors, compared with a float32 matrix of the same size."""
+        if self.quantizer is None:
+            return {"vectors": 0, "float32_bytes": 0, "quantized_bytes": 0, "compression": 1.0}
+        float32_bytes = self._size * self.quantizer.dim * 4
+        quantized_bytes = self._size * self.quantizer.code_size + self.quantizer.codebook_bytes
+        return {
+            "vectors": self._size,
+            "float32_bytes": float32_bytes,
+            "quantized_bytes": quantized_bytes,
+            "compression": float32_bytes / max(quantized_bytes, 1),
+        }
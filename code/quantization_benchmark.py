@@ -0,0 +1,95 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ann_benchmark import make_clustered_vectors, recall_at_k
+from file_utils import save_text_to_file
+from numpy_vector_store import NumpyVectorStore
+from paths import OUTPUTS_DIR
+from quantization import QuantizedVectorStore
+
+
+def load_file_vectors(file_path: str, n_queries: int) -> tuple[np.ndarray, np.ndarray]:
+    """Embeds the chunks of a file as process_file does; the first chunks double as queries."""
+    from chunking import create_splitter
+    from embedding_cache import get_embeddings
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        chunks = create_splitter().split_text(f.read())
+    vectors = np.asarray(get_embeddings("all-MiniLM-L6-v2").embed_documents(chunks), dtype=np.float32)
+    return vectors, vectors[:n_queries]
+
+
+def build_store(store: NumpyVectorStore, vectors: np.ndarray) -> tuple[NumpyVectorStore, float]:
+    """Adds the vectors to a store and returns it with the build time in seconds."""
+    started = time.perf_counter()
+    store.add_vectors(vectors, [Document(page_content=str(row)) for row in range(len(vectors))])
+    return store, time.perf_counter() - started
+
+
+def search_rows(store: NumpyVectorStore, queries: np.ndarray, k: int) -> tuple[list[np.ndarray], float]:
+    """Runs the queries and returns the result rows with the latency in ms per query."""
+    started = time.perf_counter()
+    results = store.search_by_vectors(queries, k=k)
+    latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    return [np.array([int(document.page_content) for document, _ in hits]) for hits in results], latency_ms
+
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int, n_subspaces: int,
+                  rerank_candidates: list[int]) -> str:
+    """Compares quantized stores with the float32 NumpyVectorStore and returns a markdown report."""
+    float_store, build_s = build_store(NumpyVectorStore(None), vectors)
+    exact_rows, exact_ms = search_rows(float_store, queries, k)
+    float32_mb = vectors.shape[0] * vectors.shape[1] * 4 / 1024 ** 2
+
+    content = ["# QUANTIZED VECTOR STORE BENCHMARK", "=" * 60, ""]
+    content.append(f"{len(vectors):,} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{k}")
+    content.append("")
+    content.append(f"| Storage | Re-rank | Vector memory (MB) | Compression | Recall@{k} | Latency (ms/query) | Build (s) |")
+    content.append("|---------|---------|--------------------|-------------|-----------|--------------------|-----------|")
+    content.append(f"| float32 | - | {float32_mb:.2f} | 1.0x | 1.000 | {exact_ms:.3f} | {build_s:.2f} |")
+    for mode in ("int8", "pq"):
+        for candidates in rerank_candidates:
+            store, build_s = build_store(
+                QuantizedVectorStore(None, mode=mode, n_subspaces=n_subspaces, rerank_candidates=candidates), vectors
+            )
+            rows, latency_ms = search_rows(store, queries, k)
+            usage = store.memory_usage()
+            label = f"{mode} (m={n_subspaces})" if mode == "pq" else mode
+            content.append(
+                f"| {label} | {candidates or '-'} | {usage['quantized_bytes'] / 1024 ** 2:.2f} | "
+                f"{usage['compression']:.1f}x | {recall_at_k(rows, np.asarray(exact_rows)):.3f} | "
+                f"{latency_ms:.3f} | {build_s:.2f} |"
+            )
+    content.append("")
+    content.append("Re-ranked stores keep their float32 vectors in a disk-backed file, not in the resident matrix.")
+    content.append("")
+    return "\n".join(content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory saved and recall lost by quantized embedding storage.")
+    parser.add_argument("--file", help="Embed the chunks of this text file instead of synthetic vectors.")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Number of synthetic vectors.")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension (all-MiniLM-L6-v2 uses 384).")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--k", type=int, default=10, help="Results per query.")
+    parser.add_argument("--subspaces", type=int, default=48, help="Product quantization subspaces.")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 50, 200],
+                        help="Re-ranking candidate counts (0 disables re-ranking).")
+    args = parser.parse_args()
+
+    if args.file:
+        vectors, queries = load_file_vectors(args.file, args.queries)
+    else:
+        data = make_clustered_vectors(args.vectors + args.queries, args.dim, clusters=256, noise_scale=0.3)
+        vectors, queries = data[:args.vectors], data[args.vectors:]
+
+    report = run_benchmark(vectors, queries, args.k, args.subspaces, args.rerank)
+    print(report)
+    filename = "quantization_benchmark_results.md"
+    save_text_to_file(report, os.path.join(OUTPUTS_DIR, filename), header="Quantized Vector Store Benchmark Results")
+    print(f"    ✓ Results saved to {filename}")
@@ -0,0 +1,330 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from file_utils import load_yaml
+from paths import APP_CONFIG_FPATH
+from token_counter import get_token_counter, token_model_name
+
+POLL_SECONDS = 0.05
+
+
+class Priority(IntEnum):
+    """Scheduling priority of an LLM request; lower values are served first."""
+    INTERACTIVE = 0
+    BATCH = 1
+    BACKGROUND = 2
+
+
+_current_priority: ContextVar[Priority] = ContextVar("request_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: Priority) -> Iterator[None]:
+    """Runs the LLM calls made inside the block (in this thread or task) with the given priority.
+
+    Example:
+        with request_priority(Priority.BACKGROUND):
+            llm.invoke(summary_prompt)
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Bucket holding up to `capacity` units, refilled continuously at `capacity` per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they are available now)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) * 60.0 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        """Takes units out of the bucket; the level may go negative when usage is settled later."""
+        self.level -= amount
+
+
+@dataclass(order=True)
+class Ticket:
+    """A queued request: ordered by priority, then arrival. Once granted, `reserved` holds the tokens
+    actually taken from the tokens/min bucket (the estimate, capped at the bucket capacity)."""
+    priority: int
+    sequence: int
+    tokens: int = field(compare=False)
+    enqueued: float = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    reserved: float = field(default=0.0, compare=False)
+
+
+@dataclass
+class WaitStats:
+    """Running count, sum and maximum of queue wait times, so metrics stay constant-size."""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def observe(self, wait: float) -> None:
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+@dataclass
+class ProviderState:
+    """Limits, waiting queue and metrics of one provider."""
+    requests: TokenBucket
+    tokens: TokenBucket
+    queue: list[Ticket] = field(default_factory=list)
+    granted: int = 0
+    max_queue_depth: int = 0
+    waits: dict[Priority, WaitStats] = field(default_factory=lambda: {priority: WaitStats() for priority in Priority})
+
+
+class RequestScheduler:
+    """Process-wide scheduler that keeps LLM requests within per-provider requests/min and tokens/min limits.
+
+    Each request waits in a per-provider priority queue until it is at the head and both token buckets
+    can cover it, so interactive turns overtake queued background work such as summarization. Token
+    reservations are estimated before the call and corrected with the provider-reported usage afterwards.
+    """
+
+    def __init__(self, limits: dict[str, dict]):
+        self._providers = {
+            provider: ProviderState(TokenBucket(cfg["requests_per_minute"]), TokenBucket(cfg["tokens_per_minute"]))
+            for provider, cfg in limits.items()
+        }
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def limits(self, provider: str) -> bool:
+        """Returns True if requests to this provider are rate limited by the scheduler."""
+        return provider in self._providers
+
+    def _enqueue(self, provider: str, tokens: int, priority: Priority | None) -> Ticket:
+        ticket = Ticket(int(_current_priority.get() if priority is None else priority), next(self._sequence),
+                        tokens, time.monotonic())
+        with self._condition:
+            state = self._providers[provider]
+            heapq.heappush(state.queue, ticket)
+            state.max_queue_depth = max(state.max_queue_depth, len(state.queue))
+        return ticket
+
+    def _try_grant(self, provider: str, ticket: Ticket) -> float:
+        """Grants the ticket if it is first in line and within limits; otherwise returns how long to wait.
+
+        Must be called with the condition held.
+        """
+        state = self._providers[provider]
+        if state.queue[0] is not ticket:
+            return POLL_SECONDS
+        now = time.monotonic()
+        delay = max(state.requests.time_until(1, now), state.tokens.time_until(ticket.tokens, now))
+        if delay > 0:
+            return delay
+        heapq.heappop(state.queue)
+        state.requests.consume(1)
+        ticket.reserved = min(ticket.tokens, state.tokens.capacity)
+        state.tokens.consume(ticket.reserved)
+        state.granted += 1
+        state.waits[Priority(ticket.priority)].observe(now - ticket.enqueued)
+        ticket.granted = True
+        self._condition.notify_all()
+        return 0.0
+
+    def acquire(self, provider: str, tokens: int, priority: Priority | None = None) -> Ticket | None:
+        """Blocks until a request of `tokens` estimated tokens may be sent; returns the granted ticket to
+        settle once the request has finished (None if the provider is not rate limited).
+
+        Args:
+            provider: Provider name as in llms.MODEL_PROVIDERS.
+            tokens: Estimated prompt plus completion tokens.
+            priority: Defaults to the priority set with `request_priority` (interactive otherwise).
+        """
+        if provider not in self._providers:
+            return None
+        ticket = self._enqueue(provider, tokens, priority)
+        with self._condition:
+            while (delay := self._try_grant(provider, ticket)) > 0:
+                self._condition.wait(timeout=delay)
+        return ticket
+
+    async def aacquire(self, provider: str, tokens: int, priority: Priority | None = None) -> Ticket | None:
+        """Async variant of acquire that sleeps on the event loop instead of blocking it."""
+        if provider not in self._providers:
+            return None
+        ticket = self._enqueue(provider, tokens, priority)
+        try:
+            while True:
+                with self._condition:
+                    delay = self._try_grant(provider, ticket)
+                if delay == 0:
+                    return ticket
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self._discard(provider, ticket)
+            raise
+
+    def _discard(self, provider: str, ticket: Ticket) -> None:
+        """Removes a ticket whose caller gave up waiting."""
+        with self._condition:
+            state = self._providers[provider]
+            if not ticket.granted and ticket in state.queue:
+                state.queue.remove(ticket)
+                heapq.heapify(state.queue)
+                self._condition.notify_all()
+
+    def settle(self, provider: str, ticket: Ticket | None, actual_tokens: int | None) -> None:
+        """Corrects the tokens/min bucket with the provider-reported usage of a finished request, against
+        the tokens its ticket actually reserved."""
+        if provider not in self._providers or ticket is None or actual_tokens is None:
+            return
+        with self._condition:
+            self._providers[provider].tokens.consume(actual_tokens - ticket.reserved)
+
+    def metrics(self) -> dict[str, dict]:
+        """Queue depth and wait time metrics per provider."""
+        with self._condition:
+            result = {}
+            for provider, state in self._providers.items():
+                count = sum(waits.count for waits in state.waits.values())
+                result[provider] = {
+                    "queue_depth": len(state.queue),
+                    "max_queue_depth": state.max_queue_depth,
+                    "granted": state.granted,
+                    "avg_wait_s": sum(waits.total for waits in state.waits.values()) / count if count else 0.0,
+                    "max_wait_s": max(waits.max for waits in state.waits.values()),
+                    "avg_wait_s_by_priority": {
+                        priority.name.lower(): waits.mean for priority, waits in state.waits.items() if waits.count
+                    },
+                }
+            return result
+
+    def format_metrics(self) -> str:
+        """Markdown table of the scheduler metrics of providers that received requests ("" if none did)."""
+        content = ["| Provider | Requests | Queue Depth | Max Queue Depth | Avg Wait (s) | Max Wait (s) | Avg Wait by Priority (s) |",
+                   "|----------|----------|-------------|-----------------|--------------|--------------|--------------------------|"]
+        for provider, row in self.metrics().items():
+            if not row["granted"] and not row["queue_depth"]:
+                continue
+            by_priority = ", ".join(f"{name}: {wait:.2f}" for name, wait in row["avg_wait_s_by_priority"].items())
+            content.append(f"| {provider} | {row['granted']} | {row['queue_depth']} | {row['max_queue_depth']} "
+                           f"| {row['avg_wait_s']:.2f} | {row['max_wait_s']:.2f} | {by_priority or 'n/a'} |")
+        return "\n".join(content) if len(content) > 2 else ""
+
+
+@lru_cache(maxsize=None)
+def get_scheduler() -> RequestScheduler:
+    """Returns the process-wide scheduler configured by the `rate_limits` section of the app config."""
+    limits_cfg = load_yaml(APP_CONFIG_FPATH).get("rate_limits", {})
+    if not limits_cfg.get("enabled", False):
+        return RequestScheduler({})
+    return RequestScheduler(limits_cfg.get("providers", {}))
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model wrapper that passes every request through the shared RequestScheduler.
+
+    Requests are admitted with an estimate of prompt tokens (counted locally) plus
+    `expected_output_tokens`; the estimate is settled with the reported usage when available.
+    Everything else, including `_llm_type` and the model name, is the wrapped model's.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model: BaseChatModel
+    provider: str
+    scheduler: RequestScheduler
+    expected_output_tokens: int = 256
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def model_name(self) -> str:
+        return token_model_name(self.model)
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        # Part of the response cache key, so wrapped models must not share entries
+        return {**self.model._identifying_params, "model_name": self.model_name, "provider": self.provider}
+
+    def estimate_tokens(self, messages: list[BaseMessage]) -> int:
+        """Estimated prompt plus completion tokens of a request."""
+        counter = get_token_counter(self.model_name, include_publication=True)
+        return counter.count_messages(messages) + self.expected_output_tokens
+
+    def _settle(self, ticket: Ticket | None, message: BaseMessage) -> None:
+        usage = getattr(message, "usage_metadata", None)
+        self.scheduler.settle(self.provider, ticket, usage.get("total_tokens") if usage else None)
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        ticket = self.scheduler.acquire(self.provider, self.estimate_tokens(messages))
+        message = self.model.invoke(messages, stop=stop, **kwargs)
+        self._settle(ticket, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        ticket = await self.scheduler.aacquire(self.provider, self.estimate_tokens(messages))
+        message = await self.model.ainvoke(messages, stop=stop, **kwargs)
+        self._settle(ticket, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        ticket = self.scheduler.acquire(self.provider, self.estimate_tokens(messages))
+        message = None
+        for chunk in self.model.stream(messages, stop=stop, **kwargs):
+            message = chunk if message is None else message + chunk
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+        if message is not None:
+            self._settle(ticket, message)
+
+    async def _astream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        ticket = await self.scheduler.aacquire(self.provider, self.estimate_tokens(messages))
+        message = None
+        async for chunk in self.model.astream(messages, stop=stop, **kwargs):
+            message = chunk if message is None else message + chunk
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+        if message is not None:
+            self._settle(ticket, message)
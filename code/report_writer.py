@@ -0,0 +1,151 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+from paths import OUTPUTS_DIR
+
+STRATEGY_DESCRIPTIONS = {
+    "stuffing": "Keeps ALL previous messages in conversation history.",
+    "trimming": "Keeps only the most recent N messages in conversation history.",
+    "summarization": "Summarizes older messages and keeps recent messages for context.",
+    "retrieval": "Keeps recent messages plus the past Q/A pairs most relevant to the current question.",
+    "batch": "Answers each question independently with only the system prompt, without conversation history."
+}
+
+TOKEN_FIELDS = ["question_num", "prompt_tokens", "response_tokens", "total_tokens", "latency_s", "ttft_s",
+                "cached_prompt_tokens", "uncached_prompt_tokens"]
+SIDECAR_FORMATS = ("jsonl", "csv")
+
+
+def format_cache_tokens(token_data: dict, key: str) -> str:
+    """Formats a provider-reported prompt cache token count for the token progression table."""
+    value = token_data.get(key)
+    return "n/a" if value is None else f"{value:,}"
+
+
+def format_token_row(token_data: dict) -> str:
+    """Formats one row of the token progression table."""
+    return (f"| {token_data['question_num']} | {token_data['prompt_tokens']:,} | {token_data['response_tokens']:,} "
+            f"| {token_data['total_tokens']:,} | {format_cache_tokens(token_data, 'cached_prompt_tokens')} "
+            f"| {format_cache_tokens(token_data, 'uncached_prompt_tokens')} |")
+
+
+class StrategyReportWriter:
+    """Writes the results report of a memory strategy run while the run is in progress.
+
+    Q&A pairs are appended to `lesson3a_strategy_<strategy>_results.md` as they are answered, through a
+    buffer flushed every `flush_every` entries, so memory stays flat and an interrupted run leaves a
+    readable partial report. Token rows are spooled to a temporary file and copied into the report as
+    the token progression table when it is closed, followed by the final prompt. With `sidecar` set to
+    "jsonl" or "csv", token rows are also written to `lesson3a_strategy_<strategy>_tokens.<sidecar>`.
+
+    Results that already exist, e.g. those of an interrupted run rebuilt from its conversation log, are
+    passed as `qa_pairs` and `token_rows`. They are written to temporary files that replace the previous
+    report and sidecar only once complete, so the previous partial report is never lost.
+    """
+
+    def __init__(self, strategy: str, output_dir: str = OUTPUTS_DIR, sidecar: str | None = None,
+                 flush_every: int = 1, buffer_size: int = 64 * 1024, qa_pairs: list[dict] = (),
+                 token_rows: list[dict] = ()):
+        if sidecar is not None and sidecar not in SIDECAR_FORMATS:
+            raise ValueError(f"Unknown sidecar format: {sidecar}. Use one of {SIDECAR_FORMATS}.")
+        os.makedirs(output_dir, exist_ok=True)
+        self.strategy = strategy
+        self.filename = f"lesson3a_strategy_{strategy}_results.md"
+        self.path = os.path.join(output_dir, self.filename)
+        self.flush_every = flush_every
+        self.questions = 0
+        self._unflushed = 0
+        self._report = open(f"{self.path}.tmp", "w", encoding="utf-8", buffering=buffer_size)
+        self._token_rows = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._sidecar = None
+        self._sidecar_writer = None
+        self.sidecar_path = None
+        if sidecar is not None:
+            self.sidecar_path = os.path.join(output_dir, f"lesson3a_strategy_{strategy}_tokens.{sidecar}")
+            self._sidecar = open(f"{self.sidecar_path}.tmp", "w", encoding="utf-8", newline="",
+                                 buffering=buffer_size)
+            if sidecar == "csv":
+                self._sidecar_writer = csv.DictWriter(self._sidecar, fieldnames=["strategy"] + TOKEN_FIELDS,
+                                                      restval="", extrasaction="ignore")
+                self._sidecar_writer.writeheader()
+        self._write_lines([
+            f"# {strategy.upper()} STRATEGY RESULTS", "=" * 60, "",
+            "## Strategy Description", STRATEGY_DESCRIPTIONS.get(strategy, "Unknown strategy"), "",
+            "## All Q&A Pairs", ""
+        ])
+        for qa in qa_pairs:
+            self.add_qa(qa["question"], qa["response"])
+        for token_data in token_rows:
+            self.add_token_row(token_data)
+        self.flush()
+        # The open files keep writing to the same inodes under their final names
+        os.replace(f"{self.path}.tmp", self.path)
+        if self.sidecar_path is not None:
+            os.replace(f"{self.sidecar_path}.tmp", self.sidecar_path)
+
+    def __enter__(self) -> "StrategyReportWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _write_lines(self, lines: list[str]) -> None:
+        self._report.write("\n".join(lines) + "\n")
+
+    def _entry_written(self) -> None:
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def add_qa(self, question: str, response: str, question_num: int | None = None) -> None:
+        """Appends a Q&A pair to the report, numbered after the previous one unless `question_num` is given."""
+        self.questions = question_num or self.questions + 1
+        self._write_lines([
+            f"### Question {self.questions}", f"**User:** {question}", "", f"**Assistant:** {response}", "",
+            "-" * 40, ""
+        ])
+        self._entry_written()
+
+    def add_token_row(self, token_data: dict) -> None:
+        """Records the token usage of one question for the report table and the sidecar."""
+        self._token_rows.write(format_token_row(token_data) + "\n")
+        if self._sidecar_writer is not None:
+            self._sidecar_writer.writerow({"strategy": self.strategy, **token_data})
+        elif self._sidecar is not None:
+            self._sidecar.write(json.dumps({"strategy": self.strategy, **token_data}) + "\n")
+        self._entry_written()
+
+    def flush(self) -> None:
+        """Writes buffered entries to disk."""
+        self._report.flush()
+        if self._sidecar is not None:
+            self._sidecar.flush()
+        self._unflushed = 0
+
+    def close(self, final_question: str | None = None, final_prompt: str = "", final_response: str = "") -> None:
+        """Appends the token progression table and, if given, the final prompt for the last question."""
+        if self._report.closed:
+            return
+        self._write_lines([
+            "## Token Usage Progression",
+            "Prompt tokens are estimated locally without the publication; cached/uncached prompt tokens are "
+            "reported by the provider for the full prompt (n/a if the provider does not report them).",
+            "",
+            "| Question | Prompt Tokens | Response Tokens | Total | Cached Prompt Tokens | Uncached Prompt Tokens |",
+            "|----------|---------------|-----------------|-------|----------------------|------------------------|"
+        ])
+        self._token_rows.seek(0)
+        shutil.copyfileobj(self._token_rows, self._report)
+        self._token_rows.close()
+        self._write_lines([""])
+        if final_question is not None:
+            self._write_lines([
+                "## Complete Final Prompt for Last Question", f"**Last Question:** '{final_question}'", "",
+                "```", final_prompt, "```", "", "**Final Response:**", "```", final_response, "```", ""
+            ])
+        self._report.close()
+        if self._sidecar is not None:
+            self._sidecar.close()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import lru_cache
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from file_utils import load_yaml
+from paths import APP_CONFIG_FPATH, RESPONSE_CACHE_FPATH
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Reduces a serialized message list to its roles and contents, dropping ids and metadata.
+
+    LangChain passes chat prompts to the cache as a JSON dump of the message objects; two requests
+    with the same messages should hit the same entry even if message ids or metadata differ.
+    """
+    try:
+        messages = json.loads(prompt)
+    except json.JSONDecodeError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    normalized = []
+    for message in messages:
+        if not isinstance(message, dict):
+            return prompt
+        kwargs = message.get("kwargs", {})
+        normalized.append([kwargs.get("type") or message.get("id", [""])[-1], kwargs.get("content", "")])
+    return json.dumps(normalized, ensure_ascii=False)
+
+
+class ResponseCache(BaseCache):
+    """Two-tier LangChain LLM cache: an in-memory LRU in front of a local SQLite table.
+
+    Entries are keyed by a hash of the model settings and the normalized message list, expire after
+    `ttl_seconds`, and each tier is bounded by its own entry limit (least recently used entries are
+    evicted first).
+    """
+
+    def __init__(self, db_path: str = RESPONSE_CACHE_FPATH, ttl_seconds: float = 7 * 24 * 3600,
+                 max_memory_entries: int = 256, max_disk_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[float, list[Generation]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        """Returns the cache key for a prompt and the serialized model settings."""
+        return hashlib.sha256(f"{llm_string}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Sequence[Generation] | None:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                created_at, generations = self._memory[key]
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return generations
+                del self._memory[key]
+
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            generations = loads(row[0])
+            self._remember(key, row[1], generations)
+            self.hits += 1
+            return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        generations = list(return_val)
+        with self._lock:
+            self._remember(key, now, generations)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, dumps(generations), now, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def _remember(self, key: str, created_at: float, generations: list[Generation]) -> None:
+        """Adds an entry to the in-memory tier, evicting the least recently used entries over the limit."""
+        self._memory[key] = (created_at, generations)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the hit rate."""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache configured by the `response_cache` section of the app config,
+    opening the SQLite file on first use."""
+    cache_cfg = load_yaml(APP_CONFIG_FPATH).get("response_cache", {})
+    return ResponseCache(
+        ttl_seconds=cache_cfg.get("ttl_seconds", 7 * 24 * 3600),
+        max_memory_entries=cache_cfg.get("max_memory_entries", 256),
+        max_disk_entries=cache_cfg.get("max_disk_entries", 10_000)
+    )
@@ -0,0 +1,63 @@
+import sys
+import uuid
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+# Estimated memory of an empty Chroma collection, and per indexed turn beyond its text: the embedding
+# (e.g. 384 float32 values), its HNSW graph links and the SQLite row
+COLLECTION_BYTES_ESTIMATE = 64 * 1024
+TURN_INDEX_BYTES_ESTIMATE = 4 * 1024
+
+
+class RetrievalMemory:
+    """Indexes the Q/A pairs of one conversation in a Chroma collection for semantic recall.
+
+    Each completed turn is embedded once when it is added; later turns retrieve the past turns most
+    relevant to the current question instead of resending the whole history.
+    """
+
+    def __init__(self, embeddings: Embeddings, top_k: int = 3):
+        self.top_k = top_k
+        self.turns: list[tuple[str, str]] = []
+        # Imported on first use, so the other memory strategies start without loading Chroma
+        from langchain_community.vectorstores import Chroma
+        self.vector_store = Chroma(
+            collection_name=f"conversation-{uuid.uuid4().hex}",
+            embedding_function=embeddings,
+        )
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """Indexes a completed question/answer pair."""
+        turn = len(self.turns)
+        self.turns.append((question, answer))
+        self.vector_store.add_documents(
+            [Document(page_content=f"Q: {question}\nAI: {answer}", metadata={"turn": turn})],
+            ids=[str(turn)]
+        )
+
+    def search(self, query: str, before_turn: int) -> list[int]:
+        """Returns the indices of the past turns most relevant to a query, most relevant first.
+
+        Args:
+            query: The current question.
+            before_turn: Only turns with a lower index are considered, e.g. to skip turns that are
+                already in the recent window.
+        """
+        candidates = min(before_turn, len(self.turns))
+        if candidates <= 0:
+            return []
+        documents = self.vector_store.similarity_search(
+            query, k=min(self.top_k, candidates), filter={"turn": {"$lt": before_turn}}
+        )
+        return [document.metadata["turn"] for document in documents]
+
+    def size(self) -> int:
+        """Approximate bytes held by the index: the turn texts (kept here and in Chroma) and their embeddings."""
+        text_bytes = sum(sys.getsizeof(question) + sys.getsizeof(answer) for question, answer in self.turns)
+        return (sys.getsizeof(self) + COLLECTION_BYTES_ESTIMATE + 2 * text_bytes
+                + len(self.turns) * TURN_INDEX_BYTES_ESTIMATE)
+
+    def close(self) -> None:
+        """Drops the conversation's collection."""
+        self.vector_store.delete_collection()
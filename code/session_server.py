@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import resource
+import sys
+import time
+from collections import OrderedDict
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+import memory_strategies
+from fake_llms import FakeChatModel
+from file_utils import load_yaml
+from paths import APP_CONFIG_FPATH, SESSIONS_DIR
+
+HUMAN = 0
+AI = 1
+
+
+class MessageRecord:
+    """Compact stored message; converted to a LangChain message only when a prompt is built."""
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: int, content: str):
+        self.role = role
+        self.content = content
+
+    def to_message(self) -> BaseMessage:
+        return HumanMessage(content=self.content) if self.role == HUMAN else AIMessage(content=self.content)
+
+    def size(self) -> int:
+        """Approximate bytes held by the record."""
+        return sys.getsizeof(self) + sys.getsizeof(self.content)
+
+
+class Session:
+    """Conversation of one user: its message records and the strategy state (summarizer, Q/A index).
+
+    `bytes` estimates the memory of both, so the server's memory budget also covers the strategy state.
+    """
+    __slots__ = ("session_id", "records", "state", "state_bytes", "bytes", "last_active", "lock")
+
+    def __init__(self, session_id: str, records: list[MessageRecord] | None = None):
+        self.session_id = session_id
+        self.records = records or []
+        self.state = None
+        self.state_bytes = 0
+        self.bytes = sys.getsizeof(self) + sum(record.size() for record in self.records)
+        self.last_active = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def append(self, role: int, content: str) -> None:
+        record = MessageRecord(role, content)
+        self.records.append(record)
+        self.bytes += record.size() + 8  # record plus its list slot
+
+    def update_state_size(self) -> None:
+        """Re-estimates the bytes held by the strategy state after it has changed."""
+        state_bytes = memory_strategies.strategy_state_size(self.state)
+        self.bytes += state_bytes - self.state_bytes
+        self.state_bytes = state_bytes
+
+    def messages(self) -> list[BaseMessage]:
+        return [record.to_message() for record in self.records]
+
+
+class SessionManager:
+    """Serves concurrent conversations, each under the same memory strategy.
+
+    Sessions are kept in LRU order. Sessions idle for `idle_seconds` and, when the estimated size of all
+    resident sessions exceeds `memory_budget_bytes`, the least recently used idle sessions are written to
+    `session_dir` and dropped from memory; they are loaded back transparently on their next turn. All
+    sessions share one interned system prompt message (see memory_strategies.configure).
+    """
+
+    def __init__(self, llm: BaseChatModel, strategy: str, session_dir: str = SESSIONS_DIR,
+                 memory_budget_bytes: int = 256 * 1024 ** 2, idle_seconds: float = 300.0,
+                 max_concurrent_calls: int = 64):
+        self.llm = llm
+        self.strategy = strategy
+        self.session_dir = session_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_seconds = idle_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent_calls)
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.loads = 0
+        self.turns = 0
+        os.makedirs(session_dir, exist_ok=True)
+
+    def _session_path(self, session_id: str) -> str:
+        """File of an evicted session. Session ids come from users, so the file is named by their hash."""
+        return os.path.join(self.session_dir, f"{hashlib.sha256(session_id.encode('utf-8')).hexdigest()}.json")
+
+    def _restore_state(self, session: Session) -> None:
+        """Recreates the strategy state of a session loaded from disk from its history."""
+        session.state = memory_strategies.create_strategy_state(self.strategy)
+        if self.strategy == "retrieval":
+            for question, answer in zip(session.records[::2], session.records[1::2]):
+                session.state.add_turn(question=question.content, answer=answer.content)
+        elif self.strategy == "summarization" and session.records:
+            memory_strategies.update_strategy_state(session.state, session.messages())
+        session.update_state_size()
+
+    def _get_session(self, session_id: str) -> Session:
+        """Returns a resident session, loading it from disk or creating it if needed."""
+        if session := self._sessions.get(session_id):
+            self._sessions.move_to_end(session_id)
+            return session
+        records = []
+        if os.path.exists(path := self._session_path(session_id)):
+            with open(path, "r", encoding="utf-8") as f:
+                records = [MessageRecord(role, content) for role, content in json.load(f)]
+            self.loads += 1
+        session = Session(session_id, records)
+        self._restore_state(session)
+        self._sessions[session_id] = session
+        self.resident_bytes += session.bytes
+        return session
+
+    def _evict(self, session: Session) -> None:
+        """Writes a session to disk and drops it from memory."""
+        tmp_path = f"{self._session_path(session.session_id)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([[record.role, record.content] for record in session.records], f)
+        os.replace(tmp_path, self._session_path(session.session_id))
+        memory_strategies.close_strategy_state(session.state)
+        del self._sessions[session.session_id]
+        self.resident_bytes -= session.bytes
+        self.evictions += 1
+
+    def enforce_budget(self) -> None:
+        """Evicts least recently used idle sessions until resident sessions fit the memory budget."""
+        for session in list(self._sessions.values()):
+            if self.resident_bytes <= self.memory_budget_bytes:
+                return
+            if not session.lock.locked():
+                self._evict(session)
+
+    def evict_idle(self) -> int:
+        """Evicts sessions without activity for idle_seconds; returns how many were evicted."""
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [session for session in self._sessions.values()
+                if session.last_active < cutoff and not session.lock.locked()]
+        for session in idle:
+            self._evict(session)
+        return len(idle)
+
+    async def run_idle_evictor(self, interval: float = 30.0) -> None:
+        """Background task that evicts idle sessions periodically."""
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+
+    async def handle_turn(self, session_id: str, question: str) -> str:
+        """Answers one user question in a session, applying the memory strategy to its history."""
+        session = self._get_session(session_id)
+        await session.lock.acquire()
+        # The session may have been evicted while this turn waited for the previous one
+        while self._sessions.get(session_id) is not session:
+            session.lock.release()
+            session = self._get_session(session_id)
+            await session.lock.acquire()
+        try:
+            session.last_active = time.monotonic()
+            conversation = session.messages() + [HumanMessage(content=question)]
+            if self.strategy in ("summarization", "retrieval"):
+                # These strategies may call the LLM or embeddings; keep them off the event loop
+                prompt = await asyncio.to_thread(memory_strategies.apply_strategy, self.strategy, conversation,
+                                                 session.state)
+            else:
+                prompt = memory_strategies.apply_strategy(self.strategy, conversation, session.state)
+            prompt.append(conversation[-1])
+            async with self._semaphore:
+                response = await self.llm.ainvoke(prompt)
+            before = session.bytes
+            session.append(HUMAN, question)
+            session.append(AI, response.content)
+            if session.state is not None:
+                conversation.append(AIMessage(content=response.content))
+                await asyncio.to_thread(memory_strategies.update_strategy_state, session.state, conversation)
+                session.update_state_size()
+            self.resident_bytes += session.bytes - before
+            session.last_active = time.monotonic()
+            self.turns += 1
+        finally:
+            session.lock.release()
+        self.enforce_budget()
+        return response.content
+
+    def close(self) -> None:
+        """Writes every resident session to disk."""
+        for session in list(self._sessions.values()):
+            self._evict(session)
+
+    @property
+    def resident_sessions(self) -> int:
+        return len(self._sessions)
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_load_test(manager: SessionManager, sessions: int, turns: int, concurrency: int) -> dict:
+    """Drives `sessions` simulated users through `turns` questions each, `concurrency` users at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    started_rss = current_rss_mb()
+
+    async def user(i: int) -> None:
+        async with semaphore:
+            for turn in range(turns):
+                await manager.handle_turn(f"user-{i}", f"Question {turn + 1} from user {i} about VAEs")
+
+    evictor = asyncio.create_task(manager.run_idle_evictor(interval=min(manager.idle_seconds, 30.0)))
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(sessions)))
+    wall_time = time.perf_counter() - started
+    evictor.cancel()
+    return {
+        "sessions": sessions,
+        "turns": manager.turns,
+        "wall_time_s": wall_time,
+        "sessions_per_s": sessions / wall_time,
+        "turns_per_s": manager.turns / wall_time,
+        "resident_sessions": manager.resident_sessions,
+        "resident_mb": manager.resident_bytes / 1024 ** 2,
+        "evictions": manager.evictions,
+        "loads": manager.loads,
+        "rss_start_mb": started_rss,
+        "rss_end_mb": current_rss_mb(),
+        "rss_peak_mb": peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the multi-session conversation server with a fake LLM.")
+    parser.add_argument("--sessions", type=int, default=2000, help="Number of simulated users.")
+    parser.add_argument("--turns", type=int, default=10, help="Questions per user.")
+    parser.add_argument("--concurrency", type=int, default=200, help="Users active at the same time.")
+    parser.add_argument("--strategy", default="trimming", choices=["stuffing", "trimming", "summarization", "retrieval"])
+    parser.add_argument("--memory-budget-mb", type=float, default=None, help="Budget for resident sessions.")
+    parser.add_argument("--session-dir", default=SESSIONS_DIR, help="Directory for evicted sessions.")
+    args = parser.parse_args()
+
+    app_cfg = load_yaml(APP_CONFIG_FPATH)
+    server_cfg = app_cfg.get("session_server", {})
+    fake_llm = FakeChatModel(latency=app_cfg.get("fake_llm_latency", 0.05))
+    memory_strategies.configure(app_cfg, fake_llm, "You are a helpful assistant answering questions about a publication.")
+    session_manager = SessionManager(
+        fake_llm,
+        args.strategy,
+        session_dir=args.session_dir,
+        memory_budget_bytes=int((args.memory_budget_mb or server_cfg.get("memory_budget_mb", 256)) * 1024 ** 2),
+        idle_seconds=server_cfg.get("idle_seconds", 300),
+        max_concurrent_calls=server_cfg.get("max_concurrent_llm_calls", 64),
+    )
+    results = asyncio.run(run_load_test(session_manager, args.sessions, args.turns, args.concurrency))
+    session_manager.close()
+    print(f"{results['sessions']} sessions, {results['turns']} turns in {results['wall_time_s']:.2f}s "
+          f"({results['sessions_per_s']:.1f} sessions/s, {results['turns_per_s']:.1f} turns/s)")
+    print(f"Resident sessions: {results['resident_sessions']} ({results['resident_mb']:.2f} MB), "
+          f"evicted {results['evictions']} times, loaded from disk {results['loads']} times")
+    print(f"RSS: {results['rss_start_mb']:.1f} MB at start, {results['rss_end_mb']:.1f} MB at end, "
+          f"{results['rss_peak_mb']:.1f} MB peak")
@@ -1,15 +1,10 @@
-import os
-
 from dotenv import load_dotenv
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_groq import ChatGroq
+
+from llms import get_model
 
 load_dotenv()
-llm = ChatGroq(
-    model_name="llama-3.1-8b-instant",
-    temperature=0.0,
-    api_key=os.getenv("GROQ_API_KEY")
-)
+llm = get_model("llama-3.1-8b-instant", temperature=0.0)
 
 publication = """
     Title: One Model, Five Superpowers: The Versatility of Variational Autoencoders
@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from file_utils import save_text_to_file
+from paths import CODE_DIR, OUTPUTS_DIR
+
+# Entry point -> (module to import, first call made after the import or None)
+ENTRY_POINTS = {
+    "llms": ("llms", "llms.get_model('llama-3.1-8b-instant')"),
+    "embedding_cache": ("embedding_cache", "embedding_cache.get_embeddings().embed_query('warm up')"),
+    "chunking": ("chunking", "chunking.create_splitter().split_text('warm up ' * 200)"),
+    "ingestion": ("ingestion", None),
+    "memory_strategies": ("memory_strategies", None),
+    "session_server": ("session_server", None),
+}
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+result = {{"import_s": imported - started, "first_call_s": None, "error": None}}
+try:
+    {first_call}
+    result["first_call_s"] = time.perf_counter() - imported if {has_first_call} else None
+except Exception as e:
+    result["error"] = f"{{type(e).__name__}}: {{e}}"
+print(json.dumps(result))
+"""
+
+
+def measure(module: str, first_call: str | None) -> dict:
+    """Imports a module and makes its first call in a fresh interpreter, so nothing is already loaded."""
+    code = PROBE.format(module=module, first_call=first_call or "pass", has_first_call=first_call is not None)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=CODE_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"import_s": None, "first_call_s": None, "error": completed.stderr.strip().splitlines()[-1]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def median_or_none(values: list[float | None]) -> float | None:
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def run_benchmark(entry_points: list[str], repeats: int) -> str:
+    """Measures cold import and first-call latency of each entry point and returns a markdown report."""
+    content = ["# STARTUP TIME BENCHMARK", "=" * 60, ""]
+    content.append(f"Median of {repeats} runs, each in a fresh `{os.path.basename(sys.executable)}` process.")
+    content.append("")
+    content.append("| Entry Point | Import (s) | First Call | First Call (s) | Note |")
+    content.append("|-------------|------------|------------|----------------|------|")
+    for name in entry_points:
+        module, first_call = ENTRY_POINTS[name]
+        runs = [measure(module, first_call) for _ in range(repeats)]
+        import_s = median_or_none([run["import_s"] for run in runs])
+        first_call_s = median_or_none([run["first_call_s"] for run in runs])
+        error = next((run["error"] for run in runs if run["error"]), "")
+        content.append(f"| {name} | {'n/a' if import_s is None else f'{import_s:.3f}'} | `{first_call or '-'}` "
+                       f"| {'n/a' if first_call_s is None else f'{first_call_s:.3f}'} | {error} |")
+        print(content[-1])
+    content.append("")
+    return "\n".join(content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import and first-call latency of the entry points.")
+    parser.add_argument("--entry-points", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS),
+                        help="Entry points to measure.")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh processes per entry point.")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.entry_points, args.repeats)
+    filename = "startup_benchmark_results.md"
+    save_text_to_file(report, os.path.join(OUTPUTS_DIR, filename), header="Startup Time Benchmark Results")
+    print(f"    ✓ Results saved to {filename}")
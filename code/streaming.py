@@ -0,0 +1,161 @@
+import sys
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from dataclasses import dataclass
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import LLMResult
+
+from token_counter import DEFAULT_TOKEN_MODEL, get_token_counter, token_model_name
+
+
+@dataclass
+class StreamStats:
+    """Timing of one streamed LLM call."""
+    ttft_s: float
+    total_s: float
+    output_tokens: int
+
+    @property
+    def tokens_per_s(self) -> float:
+        """Output tokens per second after the first token arrived."""
+        generation_s = self.total_s - self.ttft_s
+        return self.output_tokens / generation_s if generation_s > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"TTFT {self.ttft_s:.2f}s, {self.output_tokens} tokens in {self.total_s:.2f}s "
+                f"({self.tokens_per_s:.1f} tokens/s)")
+
+
+def print_token(text: str) -> None:
+    """Writes a streamed chunk to stdout without buffering."""
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def output_tokens(message: BaseMessage | None, text: str, model_name: str) -> int:
+    """Provider-reported output tokens of a message, or a local count of its text."""
+    if usage := getattr(message, "usage_metadata", None):
+        return usage.get("output_tokens", 0)
+    return get_token_counter(model_name).count_tokens(text) if text else 0
+
+
+def finish_stream(llm: BaseChatModel, message: AIMessageChunk | None, started: float,
+                  first_token_at: float | None) -> tuple[AIMessageChunk, StreamStats]:
+    """Builds the result of stream_chat/astream_chat once the last chunk has arrived."""
+    finished = time.perf_counter()
+    message = message if message is not None else AIMessageChunk(content="")
+    stats = StreamStats(
+        ttft_s=(first_token_at or finished) - started,
+        total_s=finished - started,
+        output_tokens=output_tokens(message, message.content, token_model_name(llm))
+    )
+    return message, stats
+
+
+def stream_chat(llm: BaseChatModel, messages: list[BaseMessage], on_token: Callable[[str], None] | None = print_token,
+                **kwargs: Any) -> tuple[AIMessageChunk, StreamStats]:
+    """Streams a chat completion, passing each text chunk to `on_token` as it arrives.
+
+    Args:
+        llm: Chat model to call.
+        messages: Prompt messages.
+        on_token: Called with every text chunk; None to stream silently.
+        kwargs: Extra arguments for llm.stream, e.g. prefix_cache_kwargs.
+
+    Returns:
+        The complete message (chunks merged, including provider usage metadata) and its timing.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    message = None
+    for chunk in llm.stream(messages, **kwargs):
+        if first_token_at is None and chunk.content:
+            first_token_at = time.perf_counter()
+        if on_token and chunk.content:
+            on_token(chunk.content)
+        message = chunk if message is None else message + chunk
+    return finish_stream(llm, message, started, first_token_at)
+
+
+async def astream_chat(llm: BaseChatModel, messages: list[BaseMessage],
+                       on_token: Callable[[str], None] | None = None,
+                       **kwargs: Any) -> tuple[AIMessageChunk, StreamStats]:
+    """Async variant of stream_chat, silent by default."""
+    started = time.perf_counter()
+    first_token_at = None
+    message = None
+    async for chunk in llm.astream(messages, **kwargs):
+        if first_token_at is None and chunk.content:
+            first_token_at = time.perf_counter()
+        if on_token and chunk.content:
+            on_token(chunk.content)
+        message = chunk if message is None else message + chunk
+    return finish_stream(llm, message, started, first_token_at)
+
+
+def echo_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """Chain stage that prints text chunks as they pass through, without buffering them.
+
+    Piped between two chains (e.g. `question_chain | echo_stream | ...`), it shows the first stage's
+    output live while the next stage collects the same chunks once as its input.
+    """
+    for chunk in chunks:
+        print_token(chunk)
+        yield chunk
+
+
+async def aecho_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Async variant of echo_stream."""
+    async for chunk in chunks:
+        print_token(chunk)
+        yield chunk
+
+
+class StreamTimer(BaseCallbackHandler):
+    """Callback handler that records a StreamStats for every LLM call of a chain run.
+
+    Pass it in the run config, e.g. `chain.stream(inputs, config={"callbacks": [timer]})`; after the
+    run, `timer.calls` holds one entry per model call in completion order.
+    """
+
+    def __init__(self, token_model: str = DEFAULT_TOKEN_MODEL):
+        self.token_model = token_model
+        self.calls: list[StreamStats] = []
+        self._started: dict[UUID, float] = {}
+        self._first_token: dict[UUID, float] = {}
+        self._text: dict[UUID, list[str]] = {}
+
+    def _start(self, run_id: UUID) -> None:
+        self._started[run_id] = time.perf_counter()
+        self._text[run_id] = []
+
+    def on_chat_model_start(self, serialized: dict, messages: list[list[BaseMessage]], *, run_id: UUID,
+                            **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if token:
+            self._first_token.setdefault(run_id, time.perf_counter())
+            self._text.setdefault(run_id, []).append(token)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = time.perf_counter()
+        started = self._started.pop(run_id, finished)
+        text = "".join(self._text.pop(run_id, []))
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        if not text and generation is not None:
+            text = generation.text
+        self.calls.append(StreamStats(
+            ttft_s=self._first_token.pop(run_id, finished) - started,
+            total_s=finished - started,
+            output_tokens=output_tokens(message, text, self.token_model)
+        ))
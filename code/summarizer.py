@@ -0,0 +1,105 @@
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from rate_limiter import Priority, request_priority
+from tracing import trace_stage
+
+# Estimated resident memory of the worker thread (stack pages in use and thread bookkeeping)
+WORKER_BYTES_ESTIMATE = 64 * 1024
+
+
+def format_messages_for_summary(messages: list) -> str:
+    """Formats user and AI messages as Q/AI lines for a summarization prompt."""
+    text = ""
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            text += f"Q: {msg.content}\n"
+        elif isinstance(msg, AIMessage):
+            text += f"AI: {msg.content}\n"
+    return text
+
+
+class RollingSummarizer:
+    """Keeps a rolling summary of a conversation and refreshes it in the background.
+
+    Only messages that have fallen out of the recent window since the last refresh are sent to the LLM,
+    together with the previous summary, so each refresh costs roughly the size of the new messages rather
+    than of the whole older history. Refreshes run on a single worker thread; callers pick up the latest
+    finished summary with `current`.
+    """
+
+    def __init__(self, llm: BaseChatModel, keep_recent: int = 6, wait_seconds: float = 2.0):
+        self.llm = llm
+        self.keep_recent = keep_recent
+        self.wait_seconds = wait_seconds
+        self.summary = ""
+        self.covered = 0  # Number of leading conversation messages folded into the summary
+        self.summary_calls = 0
+        self._pending: Future | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+    def schedule(self, conversation: list) -> None:
+        """Starts a background refresh if messages outside the recent window are not yet summarized.
+
+        Args:
+            conversation: Full conversation history without the system prompt. It must only be appended to.
+        """
+        self._collect(timeout=0)
+        if self._pending is not None:
+            return
+        older_count = max(len(conversation) - self.keep_recent, 0)
+        if older_count <= self.covered:
+            return
+        new_messages = list(conversation[self.covered:older_count])
+        self._pending = self._executor.submit(self._fold, self.summary, new_messages, older_count)
+
+    def current(self) -> tuple[str, int]:
+        """Returns the latest summary and how many messages it covers, waiting briefly for a running refresh.
+
+        Returns:
+            A (summary, covered) tuple. The summary is empty if none has finished in time.
+        """
+        self._collect(timeout=self.wait_seconds)
+        return self.summary, self.covered
+
+    def size(self) -> int:
+        """Approximate bytes held by the summarizer: the summary and its worker thread."""
+        return sys.getsizeof(self) + sys.getsizeof(self.summary) + WORKER_BYTES_ESTIMATE
+
+    def close(self) -> None:
+        """Stops the background worker without waiting for a running refresh."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fold(self, previous_summary: str, new_messages: list, covered: int) -> tuple[str, int]:
+        """Folds new messages into the previous summary with one LLM call."""
+        if previous_summary:
+            summary_prompt = f"""Update this summary of a conversation with the new messages below.
+Summary so far: {previous_summary}
+
+New messages:
+{format_messages_for_summary(new_messages)}
+Focus on main topics and key information. Keep under 200 words."""
+        else:
+            summary_prompt = f"""Provide a concise summary of this conversation history:{format_messages_for_summary(new_messages)}
+
+Focus on main topics and key information. Keep under 200 words."""
+        self.summary_calls += 1
+        # Summaries can wait; rate-limited providers serve interactive turns first
+        with request_priority(Priority.BACKGROUND), trace_stage("summarization"):
+            response = self.llm.invoke([HumanMessage(content=summary_prompt)])
+        return response.content, covered
+
+    def _collect(self, timeout: float) -> None:
+        """Adopts the result of a finished refresh, waiting up to `timeout` seconds."""
+        if self._pending is None:
+            return
+        try:
+            self.summary, self.covered = self._pending.result(timeout=timeout)
+        except FutureTimeoutError:
+            return
+        except Exception as e:
+            print(f"  ⚠️ Background summarization failed: {e}")
+        self._pending = None
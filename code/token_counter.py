@@ -0,0 +1,160 @@
+import hashlib
+from functools import lru_cache
+from typing import Any
+
+import tiktoken
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from constants import PUBLICATION_CONTENT_FOOTER, PUBLICATION_CONTENT_HEADER
+
+WORD_TO_TOKEN_RATIO = 1.3
+# Token model of callers that do not know the running model. tiktoken does not know it, so its tokens
+# are estimated from the word count instead of downloading an unrelated encoding
+DEFAULT_TOKEN_MODEL = "word-estimate"
+PUBLICATION_PLACEHOLDER = "[PUBLICATION CONTENT OMITTED FOR READABILITY]"
+
+# Fixed text that messages_to_string wraps around each message, counted once per role
+ROLE_PREFIXES = {
+    "system": "SYSTEM: \n\n",
+    "human": "=" * 80 + "\nQ1: \n",
+    "ai": "AI: \n\n",
+}
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str):
+    """Returns the tiktoken encoding for a model, or None if tiktoken does not know the model or cannot
+    download its BPE file (e.g. offline or behind a proxy).
+
+    Args:
+        model_name: Name of the model, e.g. 'gpt-4o-mini'.
+
+    Returns:
+        The cached encoding, or None when a word-based estimate should be used instead.
+    """
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except (KeyError, ValueError, OSError):
+        # Download failures raise requests or urllib errors, both subclasses of OSError
+        return None
+
+
+def token_model_name(llm: Any) -> str:
+    """Name of the model whose tokenizer is used for local token counts of an LLM's requests: the model
+    itself, or DEFAULT_TOKEN_MODEL if it has no name."""
+    for attribute in ("model_name", "model"):
+        if isinstance(name := getattr(llm, attribute, None), str) and name:
+            return name
+    return DEFAULT_TOKEN_MODEL
+
+
+def strip_publication(content: str) -> str:
+    """Replaces the publication block in a system prompt with a short placeholder.
+
+    Args:
+        content: System prompt content.
+
+    Returns:
+        The content with the publication omitted, or the original content if no markers are found.
+    """
+    start_idx = content.find(PUBLICATION_CONTENT_HEADER)
+    end_idx = content.find(PUBLICATION_CONTENT_FOOTER, start_idx)
+    if start_idx == -1 or end_idx == -1:
+        return content
+    return content[:start_idx] + PUBLICATION_PLACEHOLDER + content[end_idx + len(PUBLICATION_CONTENT_FOOTER):]
+
+
+class TokenCounter:
+    """Counts tokens for a single model, caching counts per message content.
+
+    Totals over a growing conversation only tokenize the messages that have not been seen
+    before, so appending, trimming or summarizing history does not re-tokenize the rest.
+    """
+
+    def __init__(self, model_name: str, include_publication: bool = False, max_entries: int = 10_000):
+        self.model_name = model_name
+        self.include_publication = include_publication
+        self.max_entries = max_entries
+        self.encoding = get_encoding(model_name)
+        self._cache: dict[tuple[str, str], int] = {}
+        self._role_overhead = dict(zip(ROLE_PREFIXES, self.count_tokens_many(list(ROLE_PREFIXES.values()))))
+        self.hits = 0
+        self.misses = 0
+
+    def count_tokens(self, text: str) -> int:
+        """Counts the tokens in a single piece of text."""
+        return self.count_tokens_many([text])[0]
+
+    def count_tokens_many(self, texts: list[str]) -> list[int]:
+        """Counts the tokens of several texts in one batched encoding pass.
+
+        Args:
+            texts: Texts to count.
+
+        Returns:
+            Token counts in the same order as the input texts.
+        """
+        if not texts:
+            return []
+        if self.encoding is None:
+            return [int(len(text.split()) * WORD_TO_TOKEN_RATIO) for text in texts]
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts)]
+
+    def message_text(self, message: BaseMessage) -> str:
+        """Returns the text of a message that counts towards the prompt."""
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if isinstance(message, SystemMessage) and not self.include_publication:
+            content = strip_publication(content)
+        return content
+
+    def message_key(self, message: BaseMessage) -> tuple[str, str]:
+        """Returns the cache key of a message: its role and a hash of its content."""
+        digest = hashlib.sha1(self.message_text(message).encode("utf-8")).hexdigest()
+        return message.type, digest
+
+    def count_messages_many(self, messages: list[BaseMessage]) -> list[int]:
+        """Counts the tokens of each message, tokenizing only messages missing from the cache.
+
+        Args:
+            messages: Messages to count.
+
+        Returns:
+            Per-message token counts, including the role overhead, in input order.
+        """
+        keys = [self.message_key(message) for message in messages]
+        missing = {}
+        for key, message in zip(keys, messages):
+            if key not in self._cache and key not in missing:
+                missing[key] = self.message_text(message)
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+
+        if missing:
+            if len(self._cache) + len(missing) > self.max_entries:
+                self._cache.clear()
+            self._cache.update(zip(missing, self.count_tokens_many(list(missing.values()))))
+        return [self._cache[key] + self._role_overhead.get(key[0], 0) for key in keys]
+
+    def count_messages(self, messages: list[BaseMessage]) -> int:
+        """Counts the total prompt tokens of a list of messages."""
+        return sum(self.count_messages_many(messages))
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_name: str, include_publication: bool = False) -> TokenCounter:
+    """Returns the shared token counter for a model, creating it on first use."""
+    return TokenCounter(model_name, include_publication=include_publication)
+
+
+def count_tokens_many(texts: list[str], model_name: str) -> list[int]:
+    """Counts the tokens of several texts for a model in one pass.
+
+    Args:
+        texts: Texts to count.
+        model_name: Name of the model whose tokenizer should be used.
+
+    Returns:
+        Token counts in the same order as the input texts.
+    """
+    return get_token_counter(model_name).count_tokens_many(texts)
+
@@ -0,0 +1,265 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from file_utils import load_yaml
+from paths import APP_CONFIG_FPATH, METRICS_DIR
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style, plus count, sum, min and max."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot counts values above every bucket
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the maximum if it is above every bucket)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5) if self.count else None,
+            "p95": self.quantile(0.95) if self.count else None,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+def format_labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    """Formats labels as a Prometheus label set, e.g. `{model="gpt-4o-mini",le="0.5"}`."""
+    pairs = [*labels, *extra.items()]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+
+class Tracer:
+    """Process-wide registry of latency and token histograms and of counters, keyed by name and labels.
+
+    Metrics are recorded by TracingCallbackHandler (LLM calls) and by `trace_stage` blocks (strategy
+    overhead such as summarization, trimming and token counting), and exported as JSON or Prometheus
+    text exposition format.
+    """
+
+    def __init__(self):
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, Any]) -> tuple[str, tuple]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = LATENCY_BUCKETS, **labels: Any) -> None:
+        """Adds a value to the histogram `name` with the given labels."""
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+            self._histograms[key].observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels: Any) -> None:
+        """Adds to the counter `name` with the given labels."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def stage(self, stage: str, **labels: Any) -> Iterator[None]:
+        """Records the wall time of the block in the `stage_duration_seconds` histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+    def to_dict(self) -> dict:
+        """All metrics as {"histograms": [...], "counters": [...]}, each entry with its name and labels."""
+        with self._lock:
+            return {
+                "histograms": [{"name": name, "labels": dict(labels), **histogram.to_dict()}
+                               for (name, labels), histogram in sorted(self._histograms.items())],
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self._counters.items())],
+            }
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels, le=str(bound))} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(labels, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self) -> str:
+        """Markdown table of the recorded histograms ("" if nothing was recorded)."""
+        content = ["| Metric | Labels | Count | Sum | P50 | P95 | Max |",
+                   "|--------|--------|-------|-----|-----|-----|-----|"]
+        for row in self.to_dict()["histograms"]:
+            labels = ", ".join(f"{key}={value}" for key, value in row["labels"].items())
+            content.append(f"| {row['name']} | {labels or '-'} | {row['count']} | {row['sum']:.4f} "
+                           f"| {row['p50']:.4f} | {row['p95']:.4f} | {row['max']:.4f} |")
+        return "\n".join(content) if len(content) > 2 else ""
+
+    def export(self, output_dir: str = METRICS_DIR, name: str = "metrics") -> tuple[str, str]:
+        """Writes `<name>.json` and `<name>.prom` to output_dir and returns their paths."""
+        os.makedirs(output_dir, exist_ok=True)
+        json_path = os.path.join(output_dir, f"{name}.json")
+        prom_path = os.path.join(output_dir, f"{name}.prom")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        with open(prom_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+
+@lru_cache(maxsize=None)
+def tracing_config() -> dict:
+    """Returns the `tracing` section of the app config, read once per process."""
+    return load_yaml(APP_CONFIG_FPATH).get("tracing", {})
+
+
+@lru_cache(maxsize=None)
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer. With `tracing.export_on_exit` set in the app config, its metrics
+    are exported to METRICS_DIR when the process exits."""
+    tracer = Tracer()
+    if tracing_enabled() and tracing_config().get("export_on_exit", False):
+        @atexit.register
+        def export_on_exit() -> None:
+            if tracer.to_dict()["histograms"]:
+                tracer.export()
+    return tracer
+
+
+def tracing_enabled() -> bool:
+    """Returns True if the `tracing` section of the app config enables instrumentation."""
+    return tracing_config().get("enabled", False)
+
+
+@contextmanager
+def trace_stage(stage: str, **labels: Any) -> Iterator[None]:
+    """Times a block of work as a named stage, e.g. `with trace_stage("summarization"): ...`. Does nothing
+    unless tracing is enabled."""
+    if not tracing_enabled():
+        yield
+        return
+    with get_tracer().stage(stage, **labels):
+        yield
+
+
+def provider_token_usage(message: BaseMessage | None, llm_output: dict | None) -> tuple[int | None, int | None]:
+    """Provider-reported (input tokens, output tokens) of a response, or (None, None) if not reported."""
+    if usage := getattr(message, "usage_metadata", None):
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    metadata = getattr(message, "response_metadata", None) or {}
+    token_usage = metadata.get("token_usage") or (llm_output or {}).get("token_usage") or {}
+    if "prompt_tokens" in token_usage:
+        return token_usage["prompt_tokens"], token_usage.get("completion_tokens")
+    return None, None
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Callback handler that records every LLM call of a model or chain run in the tracer.
+
+    Per call it records wall time, time to first token (streamed calls only), provider-reported input and
+    output tokens, and whether the response came from the LangChain response cache, labelled by model.
+    """
+
+    def __init__(self, tracer: Tracer | None = None):
+        self.tracer = tracer or get_tracer()
+        self._started: dict[UUID, tuple[float, str]] = {}
+        self._first_token: dict[UUID, float] = {}
+
+    @staticmethod
+    def _model_name(serialized: dict | None, metadata: dict | None) -> str:
+        return (metadata or {}).get("ls_model_name") or ((serialized or {}).get("id") or ["unknown"])[-1]
+
+    def on_chat_model_start(self, serialized: dict, messages: list[list[BaseMessage]], *, run_id: UUID,
+                            metadata: dict | None = None, **kwargs: Any) -> None:
+        self._started[run_id] = (time.perf_counter(), self._model_name(serialized, metadata))
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID, metadata: dict | None = None,
+                     **kwargs: Any) -> None:
+        self._started[run_id] = (time.perf_counter(), self._model_name(serialized, metadata))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if token:
+            self._first_token.setdefault(run_id, time.perf_counter())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = time.perf_counter()
+        started, model = self._started.pop(run_id, (finished, "unknown"))
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        # LangChain zeroes the cost in the usage of responses served from its cache
+        cached = (getattr(message, "usage_metadata", None) or {}).get("total_cost") == 0
+        self.tracer.increment("llm_calls_total", model=model, cached=str(cached).lower())
+        self.tracer.observe("llm_call_duration_seconds", finished - started, model=model)
+        if (first_token_at := self._first_token.pop(run_id, None)) is not None:
+            self.tracer.observe("llm_time_to_first_token_seconds", first_token_at - started, model=model)
+        input_tokens, output_tokens = provider_token_usage(message, response.llm_output)
+        if input_tokens is not None:
+            self.tracer.observe("llm_input_tokens", input_tokens, TOKEN_BUCKETS, model=model)
+        if output_tokens is not None:
+            self.tracer.observe("llm_output_tokens", output_tokens, TOKEN_BUCKETS, model=model)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        _, model = self._started.pop(run_id, (0.0, "unknown"))
+        self._first_token.pop(run_id, None)
+        self.tracer.increment("llm_errors_total", model=model, error=type(error).__name__)
+
+
+@lru_cache(maxsize=None)
+def get_tracing_handler() -> TracingCallbackHandler:
+    """Returns the callback handler that feeds the process-wide tracer."""
+    return TracingCallbackHandler(get_tracer())